@@ -0,0 +1,300 @@
+"""Load-generation benchmark for the CDC pipeline against local stand-ins.
+
+The source is a SQLite database with the student/course/registration
+schema of mysql/init/01-init.sql, seeded to a configurable size. A churn
+thread inserts, updates and deletes registrations at a fixed rate while
+ChangeDetector cycles run against it. The sink records every applied
+change instead of writing to Postgres, which gives end-to-end replication
+lag per change.
+
+Results (throughput, lag percentiles, peak RSS, bytes read per cycle) are
+written as JSON so runs of different versions can be compared:
+
+    python bench/cdc_benchmark.py --registrations 100000 --rate 200 --duration 30 --output bench.json
+
+The range strategy and consistent snapshots use MySQL-only SQL and are
+not available against SQLite.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from sqlalchemy import create_engine, text
+from services.mysql_reader import MySQLReader
+from services.change_detector import ChangeDetector
+from services.snapshot_store import SnapshotStore
+from services.pipeline import SyncPipeline
+
+TABLES = ['student', 'course', 'registration']
+
+SCHEMA = [
+    """
+    CREATE TABLE student (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name VARCHAR(100) NOT NULL,
+        student_id VARCHAR(20) UNIQUE NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE course (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        code VARCHAR(20) UNIQUE NOT NULL,
+        name VARCHAR(100) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE registration (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INT NOT NULL REFERENCES student(id),
+        course_id INT NOT NULL REFERENCES course(id),
+        registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+]
+
+class MeasuringReader(MySQLReader):
+    """MySQLReader that counts the rows and value bytes it fetches."""
+
+    def __init__(self, connection_string):
+        super().__init__(connection_string)
+        self.rows_read = 0
+        self.bytes_read = 0
+
+    def _count(self, row):
+        self.rows_read += 1
+        self.bytes_read += sum(len(str(value)) for value in row.values() if value is not None)
+
+    def _query(self, table_name, sql, params=None, max_retries=3, schema=None):
+        rows = super()._query(table_name, sql, params, max_retries, schema)
+        for row in rows:
+            self._count(row)
+        return rows
+
+    def iter_table_data(self, table_name, batch_size=1000):
+        for row in super().iter_table_data(table_name, batch_size):
+            self._count(row)
+            yield row
+
+    def _stream_batches(self, connection, sql, params, schema, batch_size):
+        for rows in super()._stream_batches(connection, sql, params, schema, batch_size):
+            for row in rows:
+                self._count(row)
+            yield rows
+
+class RecordingSink:
+    """Stands in for PostgresWriter and measures the lag of every applied change."""
+
+    def __init__(self, change_times, apply_delay=0.0):
+        self.change_times = change_times
+        self.apply_delay = apply_delay
+        self.watermarks = {}
+        self.lags = []
+        self.applied = 0
+
+    def get_watermark(self, table_name):
+        return self.watermarks.get(table_name)
+
+    def apply_changes(self, table_name, changes, checksum, watermark=None, record_status=True, row_count=None):
+        # Stands in for the round trips of a Postgres transaction
+        time.sleep(self.apply_delay)
+        now = time.monotonic()
+        ids = changes.rows.column('id')
+        keys = ([ids[i] for i in changes.inserted] + [ids[i] for i in changes.updated] +
+                [row['id'] for row in changes.deleted_keys()])
+        for key in keys:
+            changed_at = self.change_times.pop((table_name, key), None)
+            if changed_at is not None:
+                self.lags.append(now - changed_at)
+            self.applied += 1
+        if watermark is not None:
+            self.watermarks[table_name] = watermark
+
+    def mark_synced(self, table_name, row_count=None):
+        pass
+
+    def prepare_tables(self, table_names):
+        pass
+
+    def record_sync(self, table_name, row_count, checksum, watermark=None):
+        pass
+
+class Churn(threading.Thread):
+    """Inserts, updates and deletes registrations at a fixed rate."""
+
+    def __init__(self, engine, rate, students, courses, first_id, last_id, change_times):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.rate = rate
+        self.students = students
+        self.courses = courses
+        self.live_ids = list(range(first_id, last_id + 1))
+        self.change_times = change_times
+        self.operations = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def _operation(self, connection):
+        choice = random.random()
+        if choice < 0.6 or not self.live_ids:
+            result = connection.execute(text(
+                "INSERT INTO registration (student_id, course_id) VALUES (:student_id, :course_id)"
+            ), {'student_id': random.randint(1, self.students), 'course_id': random.randint(1, self.courses)})
+            key = result.lastrowid
+            self.live_ids.append(key)
+        elif choice < 0.9:
+            key = random.choice(self.live_ids)
+            connection.execute(text(
+                "UPDATE registration SET course_id = :course_id WHERE id = :id"
+            ), {'course_id': random.randint(1, self.courses), 'id': key})
+        else:
+            index = random.randrange(len(self.live_ids))
+            key = self.live_ids[index]
+            self.live_ids[index] = self.live_ids[-1]
+            self.live_ids.pop()
+            connection.execute(text("DELETE FROM registration WHERE id = :id"), {'id': key})
+        self.change_times.setdefault(('registration', key), time.monotonic())
+
+    def run(self):
+        interval = 1.0 / self.rate
+        next_at = time.monotonic()
+        while not self._stop_event.is_set():
+            with self.engine.begin() as connection:
+                self._operation(connection)
+            self.operations += 1
+            next_at += interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                self._stop_event.wait(delay)
+
+def seed(engine, students, courses, registrations):
+    with engine.begin() as connection:
+        connection.exec_driver_sql("PRAGMA journal_mode=WAL")
+        for ddl in SCHEMA:
+            connection.exec_driver_sql(ddl)
+        connection.execute(text("INSERT INTO course (id, code, name) VALUES (:id, :code, :name)"),
+                           [{'id': i, 'code': f"C{i}", 'name': f"Course {i}"} for i in range(1, courses + 1)])
+        connection.execute(text("INSERT INTO student (id, name, student_id) VALUES (:id, :name, :student_id)"),
+                           [{'id': i, 'name': f"Student {i}", 'student_id': f"S{i}"} for i in range(1, students + 1)])
+        connection.execute(text("INSERT INTO registration (id, student_id, course_id) VALUES (:id, :student_id, :course_id)"),
+                           [{'id': i, 'student_id': random.randint(1, students), 'course_id': random.randint(1, courses)}
+                            for i in range(1, registrations + 1)])
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix='cdc-bench-')
+    database_url = f"sqlite:///{os.path.join(workdir, 'source.db')}"
+    engine = create_engine(database_url)
+    seed(engine, args.students, args.courses, args.registrations)
+
+    change_times = {}
+    reader = MeasuringReader(database_url)
+    sink = RecordingSink(change_times, args.apply_delay)
+    monitored_tables = {table: {'strategy': args.strategy} for table in TABLES}
+    pipeline = SyncPipeline(reader, sink, batch_size=args.batch_size) if args.pipeline else None
+    detector = ChangeDetector(reader, sink, monitored_tables, batch_size=args.batch_size,
+                              snapshot_store=SnapshotStore(os.path.join(workdir, 'snapshots')),
+                              pipeline=pipeline)
+
+    log = io.StringIO() if args.quiet else sys.stdout
+    with contextlib.redirect_stdout(log):
+        detector.initialize()
+
+    churn = Churn(engine, args.rate, args.students, args.courses, 1, args.registrations, change_times)
+    cycles = []
+    churn.start()
+    deadline = time.monotonic() + args.duration
+    with contextlib.redirect_stdout(log):
+        while True:
+            draining = time.monotonic() >= deadline
+            if draining and churn.is_alive():
+                churn.stop()
+            rows_before, bytes_before, applied_before = reader.rows_read, reader.bytes_read, sink.applied
+            started = time.perf_counter()
+            detector.detect_and_sync()
+            cycles.append({
+                'seconds': time.perf_counter() - started,
+                'rows_read': reader.rows_read - rows_before,
+                'bytes_read': reader.bytes_read - bytes_before,
+                'changes': sink.applied - applied_before
+            })
+            if draining:
+                break
+            time.sleep(args.interval)
+
+    total_seconds = sum(cycle['seconds'] for cycle in cycles)
+    return {
+        'git_commit': git_commit(),
+        'timestamp': time.time(),
+        'config': vars(args),
+        'operations': churn.operations,
+        'cycles': len(cycles),
+        'changes_applied': sink.applied,
+        'throughput_changes_per_second': sink.applied / total_seconds if total_seconds else None,
+        'scan_rows_per_second': sum(cycle['rows_read'] for cycle in cycles) / total_seconds if total_seconds else None,
+        'cycle_seconds': {
+            'p50': percentile([cycle['seconds'] for cycle in cycles], 0.5),
+            'max': max(cycle['seconds'] for cycle in cycles)
+        },
+        'lag_seconds': {
+            'samples': len(sink.lags),
+            'p50': percentile(sink.lags, 0.5),
+            'p95': percentile(sink.lags, 0.95),
+            'p99': percentile(sink.lags, 0.99),
+            'max': max(sink.lags) if sink.lags else None
+        },
+        'bytes_read_per_cycle': sum(cycle['bytes_read'] for cycle in cycles) / len(cycles),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--courses', type=int, default=200)
+    parser.add_argument('--registrations', type=int, default=10000)
+    parser.add_argument('--strategy', default='full', choices=['full', 'stream', 'watermark'])
+    parser.add_argument('--rate', type=float, default=100, help='churn operations per second')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of churn')
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between cycles')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--pipeline', action='store_true', help="sync full and stream tables through SyncPipeline")
+    parser.add_argument('--apply-delay', type=float, default=0.0, help='seconds each apply_changes call takes')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--verbose', dest='quiet', action='store_false', help='show ChangeDetector output')
+    args = parser.parse_args()
+
+    results = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({k: results[k] for k in ('throughput_changes_per_second', 'lag_seconds',
+                                             'bytes_read_per_cycle', 'peak_rss_kb')}, indent=2))
+    print(f"Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Time row hashing: MySQLReader.hash_rows against the per-row JSON plus SHA-256 it replaced.
+
+Builds a RowSet of registration-like rows (id, student_id, course_id,
+registration_date) in memory, so no database is needed:
+
+    python bench/hash_benchmark.py --rows 1000000
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from models import TableSchema
+from services.mysql_reader import MySQLReader
+
+COLUMNS = ['id', 'student_id', 'course_id', 'registration_date']
+
+def build_rows(count):
+    schema = TableSchema('registration', COLUMNS, {'id', 'student_id', 'course_id'})
+    rows = schema.rowset()
+    started = datetime(2024, 1, 1)
+    rows.extend([(i, i % 5000 + 1, i % 200 + 1, started + timedelta(seconds=i)) for i in range(1, count + 1)])
+    return rows
+
+def json_sha256(rows):
+    """Row digests as calculated before hash_rows: sorted dict, json.dumps and SHA-256 per row."""
+    digests = []
+    for index in range(len(rows)):
+        row = rows.row(index)
+        ordered_data = {k: str(row[k]) for k in sorted(row.keys())}
+        digests.append(hashlib.sha256(json.dumps(ordered_data, sort_keys=True).encode()).hexdigest())
+    return digests
+
+def best_of(repeat, function, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = build_rows(args.rows)
+    reader = MySQLReader('sqlite://')
+    baseline = best_of(args.repeat, json_sha256, rows)
+    columnar = best_of(args.repeat, reader.hash_rows, rows)
+    print(f"{'rows':>9} {'json+sha256 s':>14} {'hash_rows s':>12} {'speedup':>8}")
+    print(f"{args.rows:>9} {baseline:>14.3f} {columnar:>12.3f} {baseline / columnar:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -16,7 +16,90 @@ POSTGRES_DATABASE = os.getenv('POSTGRES_DATABASE', 'student_registration_backup'
 
 # CDC Configuration
 POLL_INTERVAL_SECONDS = int(os.getenv('POLL_INTERVAL_SECONDS', 60))
+# Each table's poll interval adapts to its change rate within these bounds
+POLL_MIN_INTERVAL_SECONDS = float(os.getenv('POLL_MIN_INTERVAL_SECONDS', 0.5))
+POLL_MAX_INTERVAL_SECONDS = float(os.getenv('POLL_MAX_INTERVAL_SECONDS', 300))
+# Changes a busy table should accumulate between polls
+POLL_TARGET_CHANGES = int(os.getenv('POLL_TARGET_CHANGES', 50))
 BATCH_SIZE = int(os.getenv('BATCH_SIZE', 1000))
+# Default capture strategy of a table (see MONITORED_TABLES):
+# 'full' reads and hashes every row each poll; 'range' lets MySQL checksum
+# primary-key ranges and only fetches the ranges that changed; 'stream'
+# merge-joins a key-ordered scan against an on-disk snapshot in flat memory
+CHECKSUM_MODE = os.getenv('CHECKSUM_MODE', 'full')
+CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', 1000))
+# Per-table (key, digest) checkpoints; keep on a volume so restarts resume from them
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', '/var/lib/cdc')
+# Copy the existing rows of tables without a checkpoint to Postgres on startup,
+# in BACKFILL_CHUNK_SIZE-wide key ranges on BACKFILL_WORKERS processes
+BACKFILL = os.getenv('BACKFILL', 'true').lower() == 'true'
+BACKFILL_CHUNK_SIZE = int(os.getenv('BACKFILL_CHUNK_SIZE', 100000))
+BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', 4))
+# Sync 'full' and 'stream' tables as concurrent read, diff and apply stages,
+# with at most PIPELINE_QUEUE_DEPTH batches waiting between two stages
+PIPELINE = os.getenv('PIPELINE', 'true').lower() == 'true'
+PIPELINE_QUEUE_DEPTH = int(os.getenv('PIPELINE_QUEUE_DEPTH', 4))
+# `python main.py verify` splits each table into VERIFY_FANOUT key ranges,
+# checksummed on both databases on VERIFY_WORKERS threads, and splits differing
+# ranges again until they hold at most VERIFY_LEAF_ROWS rows to compare by key
+VERIFY_WORKERS = int(os.getenv('VERIFY_WORKERS', 8))
+VERIFY_FANOUT = int(os.getenv('VERIFY_FANOUT', 16))
+VERIFY_LEAF_ROWS = int(os.getenv('VERIFY_LEAF_ROWS', 1000))
+# Keep the versions that changes replace or delete in cdc.<table>_history,
+# one partition per day, dropping partitions older than HISTORY_RETENTION_DAYS (0 keeps all)
+HISTORY = os.getenv('HISTORY', 'true').lower() == 'true'
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', 30))
+# Consumers that also get every applied batch of changes: 'jsonl' appends
+# them to SINK_JSONL_DIR/changes.jsonl, rotated at SINK_JSONL_MAX_BYTES, and
+# 'socket' sends them as JSON lines to SINK_SOCKET_ADDRESS (host:port).
+# Each sink flushes every SINK_FLUSH_EVENTS events or SINK_FLUSH_SECONDS and
+# drops batches once SINK_MAX_PENDING events are waiting
+SINKS = [name.strip() for name in os.getenv('SINKS', '').split(',') if name.strip()]
+SINK_JSONL_DIR = os.getenv('SINK_JSONL_DIR', '/var/lib/cdc/changes')
+SINK_JSONL_MAX_BYTES = int(os.getenv('SINK_JSONL_MAX_BYTES', 64 * 1024 * 1024))
+SINK_SOCKET_ADDRESS = os.getenv('SINK_SOCKET_ADDRESS', 'localhost:9109')
+SINK_FLUSH_EVENTS = int(os.getenv('SINK_FLUSH_EVENTS', 1000))
+SINK_FLUSH_SECONDS = float(os.getenv('SINK_FLUSH_SECONDS', 1))
+SINK_MAX_PENDING = int(os.getenv('SINK_MAX_PENDING', 100000))
+# Tables synced in parallel per cycle; 1 keeps the sequential behaviour
+SYNC_WORKERS = int(os.getenv('SYNC_WORKERS', 1))
+# Read all tables of a cycle from one START TRANSACTION WITH CONSISTENT SNAPSHOT.
+# The snapshot is one connection, so its reads run one at a time and
+# SYNC_WORKERS then only overlaps the Postgres side; it defaults to off when
+# SYNC_WORKERS is above 1 (compare with bench/snapshot_benchmark.py --workers)
+CONSISTENT_SNAPSHOT = os.getenv('CONSISTENT_SNAPSHOT', 'true' if SYNC_WORKERS <= 1 else 'false').lower() == 'true'
 
-# Tables to monitor
-MONITORED_TABLES = ['student', 'course', 'registration']
\ No newline at end of file
+# Observability: Prometheus metrics on http://<host>:METRICS_PORT/metrics (0 disables),
+# one JSON log line per table sync, and a sampling profiler toggled with SIGUSR1
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+JSON_LOGS = os.getenv('JSON_LOGS', 'true').lower() == 'true'
+PROFILE_DIR = os.getenv('PROFILE_DIR', '/tmp/cdc-profiles')
+PROFILE_INTERVAL_SECONDS = float(os.getenv('PROFILE_INTERVAL_SECONDS', 0.005))
+
+# Tables to monitor and how each one is captured. 'strategy' defaults to
+# CHECKSUM_MODE; 'watermark' fetches only rows above the highest id already
+# replicated and runs a full reconciliation every 'reconcile_every' cycles
+# to catch updates and deletes. Primary keys are discovered from
+# information_schema; 'primary_key' overrides them with a list of columns
+MONITORED_TABLES = {
+    'student': {},
+    'course': {},
+    'registration': {'strategy': 'watermark', 'reconcile_every': 10}
+}
+
+PRIMARY_KEYS = {
+    table: settings['primary_key']
+    for table, settings in MONITORED_TABLES.items() if 'primary_key' in settings
+}
+
+# Higher priority tables are scheduled first, e.g. TABLE_PRIORITIES=registration:10,student:5
+TABLE_PRIORITIES = {
+    name: int(priority)
+    for name, priority in (item.split(':') for item in os.getenv('TABLE_PRIORITIES', '').split(',') if item)
+}
+
+# Tables whose changes must be applied to Postgres before a table's own changes when
+# both are due in the same cycle; they are polled earlier when the table changes
+TABLE_DEPENDENCIES = {
+    'registration': ['student', 'course']
+}
\ No newline at end of file
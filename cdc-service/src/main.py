@@ -1,12 +1,50 @@
+import argparse
 import time
 import sys
 from sqlalchemy.exc import OperationalError
 from services.mysql_reader import MySQLReader
 from services.postgres_writer import PostgresWriter
 from services.change_detector import ChangeDetector
+from services.snapshot_store import SnapshotStore
+from services.backfill import Backfill
+from services.pipeline import SyncPipeline
+from services.verifier import Verifier
+from services.sinks import JsonlSink, SocketSink
+from services.poll_scheduler import PollScheduler
+from services.metrics import metrics
+from services.profiler import SamplingProfiler
 import config
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replicate MySQL tables to the Postgres cdc schema.")
+    commands = parser.add_subparsers(dest='command')
+    backfill = commands.add_parser('backfill', help="copy tables to Postgres, e.g. after rebuilding the mirror, and exit")
+    backfill.add_argument('tables', nargs='*', help="tables to copy (default: all monitored tables)")
+    backfill.add_argument('--restart', action='store_true', help="copy every range again instead of resuming")
+    verify = commands.add_parser('verify', help="compare tables with their Postgres mirror and exit, "
+                                                "with status 1 if any rows differ")
+    verify.add_argument('tables', nargs='*', help="tables to verify (default: all monitored tables)")
+    verify.add_argument('--repair', action='store_true', help="copy differing rows from MySQL to Postgres")
+    return parser.parse_args()
+
+def build_sinks():
+    """The change sinks named in SINKS."""
+    policy = {'flush_events': config.SINK_FLUSH_EVENTS, 'flush_seconds': config.SINK_FLUSH_SECONDS,
+              'max_pending': config.SINK_MAX_PENDING}
+    sinks = []
+    for name in config.SINKS:
+        if name == 'jsonl':
+            sinks.append(JsonlSink(config.SINK_JSONL_DIR, config.SINK_JSONL_MAX_BYTES, **policy))
+        elif name == 'socket':
+            host, port = config.SINK_SOCKET_ADDRESS.rsplit(':', 1)
+            sinks.append(SocketSink(host, int(port), **policy))
+        else:
+            raise ValueError(f"Unknown sink: {name}")
+    return sinks
+
 def main():
+    args = parse_args()
+
     # Create MySQL connection string
     mysql_conn_string = f"mysql://{config.MYSQL_USER}:{config.MYSQL_PASSWORD}@{config.MYSQL_HOST}:{config.MYSQL_PORT}/{config.MYSQL_DATABASE}"
     
@@ -20,17 +58,26 @@ def main():
     
     print("Starting CDC service...")
     print(f"Monitoring tables: {config.MONITORED_TABLES}")
-    print(f"Poll interval: {config.POLL_INTERVAL_SECONDS} seconds")
+    print(f"Poll interval: {config.POLL_INTERVAL_SECONDS} seconds "
+          f"(adaptive, {config.POLL_MIN_INTERVAL_SECONDS}-{config.POLL_MAX_INTERVAL_SECONDS} seconds)")
+    print(f"Checksum mode: {config.CHECKSUM_MODE}")
+
+    metrics.json_logs = config.JSON_LOGS
+    if config.METRICS_PORT:
+        metrics.serve(config.METRICS_PORT)
+        print(f"Serving metrics on port {config.METRICS_PORT}")
+    SamplingProfiler(config.PROFILE_DIR, config.PROFILE_INTERVAL_SECONDS).install()
+    print(f"Send SIGUSR1 to start or stop profiling into {config.PROFILE_DIR}")
     
     # Initialize MySQL connection with retries
     mysql_reader = None
     while mysql_retries > 0:
         try:
             print(f"Attempting to connect to MySQL ({mysql_retries} retries left)...")
-            mysql_reader = MySQLReader(mysql_conn_string)
-            # Test connection
+            mysql_reader = MySQLReader(mysql_conn_string, primary_keys=config.PRIMARY_KEYS)
+            # Test connection without reading whole tables
             for table in config.MONITORED_TABLES:
-                mysql_reader.get_table_data(table)
+                mysql_reader.check_table(table)
                 print(f"Successfully connected to MySQL and read table: {table}")
             break
         except OperationalError as e:
@@ -46,7 +93,9 @@ def main():
     while postgres_retries > 0:
         try:
             print(f"Attempting to connect to PostgreSQL ({postgres_retries} retries left)...")
-            postgres_writer = PostgresWriter(postgres_conn_string)
+            postgres_writer = PostgresWriter(postgres_conn_string, batch_size=config.BATCH_SIZE,
+                                             primary_keys=config.PRIMARY_KEYS, keep_history=config.HISTORY,
+                                             history_retention_days=config.HISTORY_RETENTION_DAYS)
             # Test the connection
             with postgres_writer.engine.connect() as conn:
                 conn.execute("SELECT 1")
@@ -60,13 +109,54 @@ def main():
             print(f"PostgreSQL connection failed: {str(e)}. Retrying in {retry_delay} seconds...")
             time.sleep(retry_delay)
     
+    backfill = None
+    if config.BACKFILL or args.command == 'backfill':
+        backfill = Backfill(mysql_conn_string, postgres_conn_string, SnapshotStore(config.SNAPSHOT_DIR),
+                            chunk_size=config.BACKFILL_CHUNK_SIZE, workers=config.BACKFILL_WORKERS,
+                            primary_keys=config.PRIMARY_KEYS, keep_history=config.HISTORY,
+                            history_retention_days=config.HISTORY_RETENTION_DAYS)
+    if args.command == 'backfill':
+        # Stop the CDC service first; it resumes from the checkpoints written here
+        backfill.run(args.tables or list(config.MONITORED_TABLES), restart=args.restart)
+        return
+    if args.command == 'verify':
+        verifier = Verifier(mysql_reader, postgres_writer, workers=config.VERIFY_WORKERS,
+                            fanout=config.VERIFY_FANOUT, leaf_rows=config.VERIFY_LEAF_ROWS)
+        if verifier.run(args.tables or list(config.MONITORED_TABLES), repair=args.repair):
+            sys.exit(1)
+        return
+
+    if config.CONSISTENT_SNAPSHOT and config.SYNC_WORKERS > 1:
+        print(f"CONSISTENT_SNAPSHOT shares one MySQL connection, so the "
+              f"{config.SYNC_WORKERS} sync workers read one table at a time")
+    sinks = build_sinks()
+    if sinks:
+        print(f"Publishing changes to sinks: {', '.join(sink.name for sink in sinks)}")
     try:
         # Initialize change detector
         detector = ChangeDetector(
             mysql_reader=mysql_reader,
             postgres_writer=postgres_writer,
             monitored_tables=config.MONITORED_TABLES,
-            batch_size=config.BATCH_SIZE
+            batch_size=config.BATCH_SIZE,
+            checksum_mode=config.CHECKSUM_MODE,
+            chunk_size=config.CHUNK_SIZE,
+            snapshot_store=SnapshotStore(config.SNAPSHOT_DIR),
+            max_workers=config.SYNC_WORKERS,
+            table_priorities=config.TABLE_PRIORITIES,
+            table_dependencies=config.TABLE_DEPENDENCIES,
+            consistent_snapshot=config.CONSISTENT_SNAPSHOT,
+            backfill=backfill,
+            pipeline=SyncPipeline(mysql_reader, postgres_writer, batch_size=config.BATCH_SIZE,
+                                  queue_depth=config.PIPELINE_QUEUE_DEPTH, sinks=sinks) if config.PIPELINE else None,
+            sinks=sinks,
+            scheduler=PollScheduler(
+                config.MONITORED_TABLES,
+                initial_interval=config.POLL_INTERVAL_SECONDS,
+                min_interval=config.POLL_MIN_INTERVAL_SECONDS,
+                max_interval=config.POLL_MAX_INTERVAL_SECONDS,
+                target_changes=config.POLL_TARGET_CHANGES
+            )
         )
         
         # Start the monitoring loop
@@ -75,6 +165,9 @@ def main():
     except Exception as e:
         print(f"Fatal error in CDC service: {str(e)}")
         raise
+    finally:
+        for sink in sinks:
+            sink.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,18 +1,180 @@
-from dataclasses import dataclass
-from typing import Dict, List, Any, Optional
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Set
 from datetime import datetime
 
+DIGEST_SIZE = 16
+
+class RowSet:
+    """Rows of one query, held column by column.
+
+    Integer columns are array('q') columns, so a value costs 8 bytes
+    instead of a boxed int in a dict. A typed column that meets a NULL or
+    an out-of-range value becomes a plain list.
+    """
+
+    __slots__ = ('columns', 'values')
+
+    def __init__(self, columns, values=None):
+        self.columns = list(columns)
+        self.values = values if values is not None else [[] for _ in self.columns]
+
+    def __len__(self):
+        return len(self.values[0]) if self.values else 0
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.row(index)
+
+    def column(self, name):
+        return self.values[self.columns.index(name)]
+
+    def row(self, index):
+        """The row at index as a dict."""
+        return {name: values[index] for name, values in zip(self.columns, self.values)}
+
+    def row_values(self, index):
+        """The row at index as a tuple in column order."""
+        return tuple(values[index] for values in self.values)
+
+    def extend(self, rows):
+        """Append rows given as tuples in column order."""
+        for position, column in enumerate(zip(*rows)):
+            values = self.values[position]
+            length = len(values)
+            try:
+                values.extend(column)
+            except (TypeError, OverflowError):
+                # array.extend keeps what it appended before failing
+                self.values[position] = list(values[:length]) + list(column)
+
+    def append(self, row):
+        """Append a row given as a dict."""
+        self.extend([tuple(row[name] for name in self.columns)])
+
+@dataclass
+class TableSchema:
+    name: str
+    columns: List[str]
+    integer_columns: Set[str]
+
+    def rowset(self, columns=None):
+        """An empty RowSet for the given result columns, all columns by default."""
+        columns = self.columns if columns is None else list(columns)
+        return RowSet(columns, [array('q') if name in self.integer_columns else [] for name in columns])
+
+class KeyDigests:
+    """Packed primary keys and row digests of a table, in key order.
+
+    Keys and digests each live in one flat bytes object, so a row costs
+    its key width plus 16 bytes.
+    """
+
+    __slots__ = ('key_size', 'keys', 'digests')
+
+    def __init__(self, key_size, keys=b'', digests=b''):
+        self.key_size = key_size
+        self.keys = keys
+        self.digests = digests
+
+    @classmethod
+    def from_pairs(cls, key_size, pairs):
+        """Build from (key, digest) pairs, which must already be in key order."""
+        builder = KeyDigestsBuilder(key_size)
+        for key, digest in pairs:
+            builder.write(key, digest)
+        return builder.build()
+
+    @classmethod
+    def concat(cls, key_size, parts):
+        """Join indexes whose key ranges follow each other."""
+        parts = list(parts)
+        return cls(key_size, b''.join(part.keys for part in parts), b''.join(part.digests for part in parts))
+
+    def __len__(self):
+        return len(self.digests) // DIGEST_SIZE
+
+    def __add__(self, other):
+        return KeyDigests(self.key_size, self.keys + other.keys, self.digests + other.digests)
+
+    def key(self, index):
+        return self.keys[index * self.key_size:(index + 1) * self.key_size]
+
+    def items(self):
+        """Yield the (key, digest) pairs in key order."""
+        key_size, keys, digests = self.key_size, self.keys, self.digests
+        for index in range(len(self)):
+            yield (keys[index * key_size:(index + 1) * key_size],
+                   digests[index * DIGEST_SIZE:(index + 1) * DIGEST_SIZE])
+
+    def digest_list(self):
+        digests = self.digests
+        return [digests[offset:offset + DIGEST_SIZE] for offset in range(0, len(digests), DIGEST_SIZE)]
+
+class KeyDigestsBuilder:
+    """Collects (key, digest) pairs written in key order, like a SnapshotWriter in memory."""
+
+    __slots__ = ('key_size', '_keys', '_digests')
+
+    def __init__(self, key_size):
+        self.key_size = key_size
+        self._keys = bytearray()
+        self._digests = bytearray()
+
+    def __len__(self):
+        return len(self._digests) // DIGEST_SIZE
+
+    def write(self, key, digest):
+        self._keys += key
+        self._digests += digest
+
+    def truncate(self, count):
+        """Drop every pair after the first count."""
+        del self._keys[count * self.key_size:]
+        del self._digests[count * DIGEST_SIZE:]
+
+    def build(self, count=None):
+        """KeyDigests of the pairs written, or of only the first count of them."""
+        if count is None:
+            count = len(self)
+        return KeyDigests(self.key_size, bytes(self._keys[:count * self.key_size]),
+                          bytes(self._digests[:count * DIGEST_SIZE]))
+
 @dataclass
 class TableMetadata:
     row_count: int
     checksum: str
-    data: List[Dict[str, Any]]
+    data: RowSet
+    digests: List[bytes]
 
 @dataclass
 class Changes:
-    inserted: List[Dict[str, Any]]
-    updated: List[Dict[str, Any]]
-    deleted: List[Dict[str, Any]]
+    """Changes to apply to one table.
+
+    Inserted and updated rows are positions in rows; deleted rows are
+    packed keys, since only their key is still known. codec unpacks them.
+    """
+    rows: RowSet
+    codec: Any
+    inserted: array = field(default_factory=lambda: array('q'))
+    updated: array = field(default_factory=lambda: array('q'))
+    deleted: List[bytes] = field(default_factory=list)
+
+    def __len__(self):
+        return len(self.inserted) + len(self.updated) + len(self.deleted)
+
+    def extend(self, other):
+        """Append the changes of other, whose rows have the same columns."""
+        for kind in ('inserted', 'updated'):
+            target = getattr(self, kind)
+            for index in getattr(other, kind):
+                target.append(len(self.rows))
+                self.rows.extend([other.rows.row_values(index)])
+        self.deleted.extend(other.deleted)
+
+    def deleted_keys(self):
+        """Key-only rows of the deleted rows."""
+        return [self.codec.unpack(key) for key in self.deleted]
 
 @dataclass
 class SyncStatus:
@@ -21,4 +183,5 @@ class SyncStatus:
     last_success_sync_time: Optional[datetime]
     row_count: int
     last_checksum: str
-    status: str
\ No newline at end of file
+    status: str
+    watermark: Optional[int] = None
@@ -0,0 +1,195 @@
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from sqlalchemy import text
+from services.metrics import metrics
+from services.mysql_reader import MySQLReader
+from services.postgres_writer import PostgresWriter
+from services.snapshot_store import SnapshotStore
+
+PROGRESS_TABLE = """
+CREATE TABLE IF NOT EXISTS cdc.backfill_progress (
+    table_name VARCHAR(100) NOT NULL,
+    chunk_no BIGINT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    row_count BIGINT,
+    started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+    PRIMARY KEY (table_name, chunk_no)
+)
+"""
+
+# Reader and writer of a pool worker process, created once per process
+_worker = {}
+
+def _init_worker(mysql_url, postgres_url, primary_keys, keep_history, history_retention_days):
+    _worker['reader'] = MySQLReader(mysql_url, primary_keys=primary_keys)
+    _worker['writer'] = PostgresWriter(postgres_url, primary_keys=primary_keys, keep_history=keep_history,
+                                       history_retention_days=history_retention_days)
+
+def _copy_chunk(table, chunk_no, chunk_size, chunk_dir, batch_size):
+    """Copy one key range of a table into cdc.<table> and mark it done, in one transaction.
+
+    The range's rows in Postgres are replaced, so a range is safe to copy
+    again; with a history kept, the replaced rows move to it as deleted.
+    Its (key, digest) records are written to chunk_dir and made durable
+    before the transaction commits. Returns (rows, seconds).
+    """
+    reader, writer = _worker['reader'], _worker['writer']
+    codec = reader.get_key_codec(table)
+    column = reader.get_leading_column(table)
+    lower, upper = chunk_no * chunk_size, (chunk_no + 1) * chunk_size
+    snapshot = SnapshotStore(chunk_dir).writer(str(chunk_no), codec.size)
+    started = time.monotonic()
+    cdc_timestamp = datetime.now()
+    writer.prepare_history(table, cdc_timestamp)
+    try:
+        with writer.engine.begin() as connection:
+            writer.delete_key_range(connection, table, column, lower, upper, cdc_timestamp)
+            for rows in reader.iter_range_batches(table, lower, upper, batch_size):
+                digests = reader.hash_rows(rows)
+                for key, digest in zip(codec.pack_rows(rows), digests):
+                    snapshot.write(key, digest)
+                writer.copy_rows(connection, f"cdc.{table}", rows, range(len(rows)), 'I',
+                                 cdc_timestamp, reader.combine_digests(digests))
+            snapshot.commit()
+            connection.execute(text("""
+            UPDATE cdc.backfill_progress
+            SET status = 'done', row_count = :row_count, finished_at = CURRENT_TIMESTAMP
+            WHERE table_name = :table_name AND chunk_no = :chunk_no
+            """), {'row_count': snapshot.count, 'table_name': table, 'chunk_no': chunk_no})
+    except Exception:
+        snapshot.discard()
+        raise
+    return snapshot.count, time.monotonic() - started
+
+class Backfill:
+    """Copies existing rows of tables from MySQL to Postgres in primary-key ranges.
+
+    Ranges are chunk_size wide on the leading key column and are copied on
+    a pool of worker processes, each streaming its range from MySQL and
+    loading it with COPY. Progress is kept per range in
+    cdc.backfill_progress, so an interrupted backfill resumes with the
+    ranges that are not done yet.
+
+    Every range also leaves its (key, digest) records next to the
+    checkpoints. Once all ranges of a table are done they are joined into
+    the table's checkpoint, which ChangeDetector then starts from: its
+    first cycle replicates whatever changed while the backfill ran.
+    Copied rows are not published to change sinks.
+    """
+
+    def __init__(self, mysql_url, postgres_url, snapshot_store, chunk_size=100000, workers=4,
+                 batch_size=10000, primary_keys=None, keep_history=False, history_retention_days=30):
+        self.mysql_url = mysql_url
+        self.postgres_url = postgres_url
+        self.snapshot_store = snapshot_store
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.batch_size = batch_size
+        self.primary_keys = primary_keys or {}
+        self.keep_history = keep_history
+        self.history_retention_days = history_retention_days
+        self.mysql_reader = MySQLReader(mysql_url, primary_keys=self.primary_keys)
+        self.postgres_writer = PostgresWriter(postgres_url, primary_keys=self.primary_keys)
+
+    def _chunk_dir(self, table):
+        return os.path.join(self.snapshot_store.directory, 'backfill', table)
+
+    def _plan(self, table, restart=False):
+        """Record the ranges of a table in cdc.backfill_progress and return the ones left to copy.
+
+        Ranges from an earlier run keep their status; ranges above its
+        highest key are added. A done range whose key file is gone is
+        copied again.
+        """
+        self.mysql_reader.get_leading_column(table)  # Raises unless the leading column is an integer
+        lower, upper = self.mysql_reader.get_key_range(table)
+        with self.postgres_writer.engine.begin() as connection:
+            connection.execute(text(PROGRESS_TABLE))
+            if restart:
+                connection.execute(text("DELETE FROM cdc.backfill_progress WHERE table_name = :table_name"),
+                                   {'table_name': table})
+            if lower is not None:
+                connection.execute(text("""
+                INSERT INTO cdc.backfill_progress (table_name, chunk_no)
+                VALUES (:table_name, :chunk_no)
+                ON CONFLICT (table_name, chunk_no) DO NOTHING
+                """), [{'table_name': table, 'chunk_no': chunk_no}
+                       for chunk_no in range(lower // self.chunk_size, upper // self.chunk_size + 1)])
+            rows = connection.execute(text(
+                "SELECT chunk_no, status FROM cdc.backfill_progress WHERE table_name = :table_name ORDER BY chunk_no"
+            ), {'table_name': table}).fetchall()
+
+        chunks = SnapshotStore(self._chunk_dir(table))
+        key_size = self.mysql_reader.get_key_codec(table).size
+        chunk_nos = [row.chunk_no for row in rows]
+        pending = [row.chunk_no for row in rows
+                   if row.status != 'done' or not chunks.exists(str(row.chunk_no), key_size)]
+        return chunk_nos, pending
+
+    def _hand_off(self, table, chunk_nos):
+        """Join the key files of a table's ranges into its checkpoint and record the backfill."""
+        codec = self.mysql_reader.get_key_codec(table)
+        chunks = SnapshotStore(self._chunk_dir(table))
+        writer = self.snapshot_store.writer(table, codec.size)
+        last_key = None
+        try:
+            for chunk_no in chunk_nos:
+                for key, digest in chunks.read(str(chunk_no), codec.size):
+                    writer.write(key, digest)
+                    last_key = key
+        except Exception:
+            writer.discard()
+            raise
+        writer.commit()
+
+        watermark = codec.leading_int(last_key) if last_key is not None and codec.is_integer else None
+        self.postgres_writer.mark_backfilled(table, writer.count, writer.checksum(), watermark)
+        shutil.rmtree(chunks.directory, ignore_errors=True)
+        print(f"{datetime.now()} - Backfill of {table} complete ({writer.count} rows)")
+
+    def run(self, tables, restart=False):
+        """Backfill tables, resuming any earlier unfinished run, and write their checkpoints.
+
+        restart discards recorded progress and copies every range again.
+        """
+        plans = {table: self._plan(table, restart) for table in tables}
+        remaining = {table: len(pending) for table, (_, pending) in plans.items()}
+        for table, (chunk_nos, pending) in plans.items():
+            print(f"{datetime.now()} - Backfilling {table}: {len(pending)} of {len(chunk_nos)} ranges to copy")
+            if not pending:
+                self._hand_off(table, chunk_nos)
+
+        work = [(table, chunk_no) for table, (_, pending) in plans.items() for chunk_no in pending]
+        if not work:
+            return
+
+        # Workers open their own connections; spawned processes inherit none of ours
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker,
+                                 initargs=(self.mysql_url, self.postgres_url, self.primary_keys,
+                                           self.keep_history, self.history_retention_days)) as executor:
+            futures = {
+                executor.submit(_copy_chunk, table, chunk_no, self.chunk_size, self._chunk_dir(table),
+                                self.batch_size): table
+                for table, chunk_no in work
+            }
+            try:
+                for future in as_completed(futures):
+                    table = futures[future]
+                    row_count, seconds = future.result()
+                    metrics.inc('cdc_backfill_rows_total', row_count, table)
+                    remaining[table] -= 1
+                    print(f"{datetime.now()} - Backfilled {row_count} rows of {table} in {seconds:.2f}s "
+                          f"({row_count / max(seconds, 1e-6):.0f} rows/s), {remaining[table]} ranges left")
+                    if remaining[table] == 0:
+                        self._hand_off(table, plans[table][0])
+            except Exception:
+                # Ranges already running still finish and are recorded; the rest wait for the next run
+                for future in futures:
+                    future.cancel()
+                raise
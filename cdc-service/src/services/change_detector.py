@@ -1,59 +1,602 @@
+import hashlib
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from array import array
+from models import Changes, KeyDigests, KeyDigestsBuilder
+from services.key_codec import INTEGER_KINDS
+from services.metrics import metrics
 
 class ChangeDetector:
-    def __init__(self, mysql_reader, postgres_writer, monitored_tables, batch_size=1000):
+    def __init__(self, mysql_reader, postgres_writer, monitored_tables, batch_size=1000,
+                 checksum_mode='full', chunk_size=1000, snapshot_store=None,
+                 max_workers=1, table_priorities=None, table_dependencies=None, scheduler=None,
+                 consistent_snapshot=False, backfill=None, pipeline=None, sinks=()):
         self.mysql_reader = mysql_reader
         self.postgres_writer = postgres_writer
         self.monitored_tables = monitored_tables
         self.batch_size = batch_size
+        self.checksum_mode = checksum_mode
+        self.chunk_size = chunk_size
+        self.snapshot_store = snapshot_store
+        self.max_workers = max_workers
+        self.table_priorities = table_priorities or {}
+        self.table_dependencies = table_dependencies or {}
+        self.scheduler = scheduler
+        self.consistent_snapshot = consistent_snapshot
+        self.backfill = backfill
+        self.pipeline = pipeline
+        self.sinks = list(sinks)
         self.previous_states = {}
 
+    def _table_config(self, table):
+        """Per-table settings when monitored_tables is a dict, otherwise empty."""
+        if isinstance(self.monitored_tables, dict):
+            return self.monitored_tables[table] or {}
+        return {}
+
+    def _strategy(self, table):
+        """Capture strategy of a table, defaulting to checksum_mode."""
+        return self._table_config(table).get('strategy', self.checksum_mode)
+
+    def _key_size(self, table):
+        """Width in bytes of a table's packed primary key."""
+        return self.mysql_reader.get_key_codec(table).size
+
+    def _group_by_chunk(self, table, index):
+        """Split a table's KeyDigests by range of the leading key column."""
+        self.mysql_reader.get_leading_column(table)  # Raises unless the leading column is an integer
+        leading_int = self.mysql_reader.get_key_codec(table).leading_int
+        chunks = {}
+        for key, digest in index.items():
+            chunks.setdefault(leading_int(key) // self.chunk_size, []).append((key, digest))
+        return {chunk_no: KeyDigests.from_pairs(index.key_size, pairs) for chunk_no, pairs in chunks.items()}
+
+    def _state_index(self, table, strategy, state):
+        """KeyDigests of every row held by a table's in-memory state."""
+        if strategy == 'range':
+            chunks = state['chunks']
+            return KeyDigests.concat(self._key_size(table), (chunks[chunk_no] for chunk_no in sorted(chunks)))
+        if strategy == 'watermark':
+            appended = state['appended'].build(state['appended_count'])
+            return KeyDigests.concat(self._key_size(table), [state['index'], appended])
+        return state['index']
+
+    def _row_count(self, strategy, state):
+        """Rows of a table according to its state after a sync."""
+        if strategy == 'stream':
+            return state.count  # The snapshot writer
+        if strategy == 'range':
+            return sum(row_count for row_count, _ in state['checksums'].values())
+        if strategy == 'watermark':
+            return len(state['index']) + state['appended_count']
+        return len(state['index'])
+
+    def _save_checkpoint(self, table, index):
+        """Atomically write the (key, digest) pairs of a table to its checkpoint file."""
+        if self.snapshot_store is None:
+            return
+        with metrics.span('checkpoint', table):
+            writer = self.snapshot_store.writer(table, self._key_size(table))
+            try:
+                for key, digest in index.items():
+                    writer.write(key, digest)
+            except Exception:
+                writer.discard()
+                raise
+            writer.commit()
+
+    def _load_checkpoint(self, table):
+        """KeyDigests from a table's checkpoint, or None if there is none."""
+        if self.snapshot_store is None or not self.snapshot_store.exists(table, self._key_size(table)):
+            return None
+        index = KeyDigests.from_pairs(self._key_size(table), self.snapshot_store.read(table, self._key_size(table)))
+        print(f"{datetime.now()} - Resuming {table} from checkpoint ({len(index)} rows)")
+        return index
+
     def initialize(self):
-        """Initialize previous states for all monitored tables."""
+        """Initialize previous states for all monitored tables.
+
+        A table with a checkpoint from an earlier run starts from it, so the
+        first cycle replicates whatever changed while the service was down.
+        With a backfill, tables without one are first copied to Postgres,
+        which leaves them a checkpoint. Other tables take a fresh snapshot
+        as their baseline.
+        """
+        self.postgres_writer.prepare_tables(list(self.monitored_tables))
+        if self.backfill is not None:
+            self._backfill_tables()
+        if self.consistent_snapshot:
+            with self.mysql_reader.consistent_snapshot():
+                self._initialize_tables()
+        else:
+            self._initialize_tables()
+
+    def _backfill_tables(self):
+        """Backfill the tables that have no checkpoint yet, so their existing rows reach Postgres."""
+        tables = [
+            table for table in self.monitored_tables
+            if self.mysql_reader.get_key_codec(table).kinds[0] in INTEGER_KINDS
+            and not self.snapshot_store.exists(table, self._key_size(table))
+        ]
+        if tables:
+            self.backfill.run(tables)
+
+    def _initialize_tables(self):
         for table in self.monitored_tables:
-            metadata = self.mysql_reader.get_table_metadata(table)
-            self.previous_states[table] = metadata['data']
+            with metrics.table_cycle(table, phase='initialize', strategy=self._strategy(table)):
+                self._initialize_table(table)
+
+    def _initialize_table(self, table):
+        """Build the baseline state of one table from its checkpoint or a fresh read."""
+        strategy = self._strategy(table)
+        if strategy == 'stream':
+            # The stream snapshot file doubles as the checkpoint
+            if self.snapshot_store.exists(table, self._key_size(table)):
+                print(f"{datetime.now()} - Resuming {table} from checkpoint")
+                return
+            writer = self.snapshot_store.writer(table, self._key_size(table))
+            for row in self.mysql_reader.iter_table_data(table, self.batch_size):
+                writer.write(self.mysql_reader.get_key(table, row), self.mysql_reader.calculate_digest(row))
+            writer.commit()
+            return
+
+        # States keep only the packed key and digest of each row
+        checkpoint = self._load_checkpoint(table)
+        if strategy == 'range':
+            if checkpoint is None:
+                # Read checksums before rows: a row changed in between then shows
+                # up as a checksum mismatch on the next poll instead of being lost
+                checksums = self.mysql_reader.get_range_checksums(table, self.chunk_size)
+                metadata = self.mysql_reader.get_table_metadata(table)
+                index = self.mysql_reader.index_rows(table, metadata['keys'], metadata['digests'])
+            else:
+                # Without stored range checksums every range is compared once
+                checksums = {}
+                index = checkpoint
+            self.previous_states[table] = {'checksums': checksums, 'chunks': self._group_by_chunk(table, index)}
+        elif strategy == 'watermark':
+            codec = self.mysql_reader.get_key_codec(table)
+            if not codec.is_integer:
+                raise ValueError(f"Watermark capture needs a single integer primary key in {table}")
+            watermark = self.postgres_writer.get_watermark(table)
+            if checkpoint is None:
+                metadata = self.mysql_reader.get_table_metadata(table)
+                index = self.mysql_reader.index_rows(table, metadata['keys'], metadata['digests'])
+                checksum = metadata['checksum']
+                if watermark is not None:
+                    # Rows above the stored mark were inserted while the service
+                    # was down; leave them out so the first cycle replicates them
+                    index = KeyDigests.from_pairs(index.key_size, (
+                        (key, digest) for key, digest in index.items() if codec.leading_int(key) <= watermark
+                    ))
+            else:
+                index = checkpoint
+                checksum = self.mysql_reader.combine_digests(index.digest_list())
+                # Checkpoints are only written on reconciliation; rows inserted
+                # after the last one are fetched and applied again
+                watermark = codec.leading_int(index.key(len(index) - 1)) if len(index) else 0
+            if watermark is None:
+                watermark = codec.leading_int(index.key(len(index) - 1)) if len(index) else 0
+            self.previous_states[table] = {
+                'index': index,
+                'appended': KeyDigestsBuilder(codec.size),
+                'appended_count': 0,
+                'watermark': watermark,
+                'checksum': checksum,
+                'cycles': 0
+            }
+        else:
+            if checkpoint is None:
+                metadata = self.mysql_reader.get_table_metadata(table)
+                index = self.mysql_reader.index_rows(table, metadata['keys'], metadata['digests'])
+                self.previous_states[table] = {'index': index}
+            else:
+                self.previous_states[table] = {'index': checkpoint}
+
+        if checkpoint is None:
+            self._save_checkpoint(table, self._state_index(table, strategy, self.previous_states[table]))
+
+    def _detect_full_changes(self, table, previous_state=None):
+        """Detect changes by reading and hashing the whole table.
+
+        The state keeps each row's packed key and digest, so only the current
+        rows are hashed. Returns the changes, the checksum and the new index.
+        """
+        current_metadata = self.mysql_reader.get_table_metadata(table)
+        if previous_state is None:
+            previous_state = self.previous_states.get(table, {'index': KeyDigests(self._key_size(table))})
+        changes = self.mysql_reader.compare_data(
+            table,
+            previous_state['index'],
+            current_metadata['data'],
+            current_metadata['digests'],
+            current_metadata['keys']
+        )
+        index = self.mysql_reader.index_rows(table, current_metadata['keys'], current_metadata['digests'])
+        return changes, current_metadata['checksum'], {'index': index}
 
-    def detect_and_sync(self):
-        """Detect changes in all monitored tables and sync them."""
+    def _detect_watermark_changes(self, table):
+        """Detect changes by fetching only the rows above the high-water mark.
+
+        Suited to append-mostly tables with an AUTO_INCREMENT key. Every
+        reconcile_every cycles a full scan runs instead, which catches updates,
+        deletes and rows committed out of key order below the mark.
+
+        A poll costs as much as the rows it fetches: their keys and digests
+        are appended in place to the state's appended builder, whose
+        appended_count is only advanced in the new state, so a cycle whose
+        apply fails leaves the old state intact. The state is only joined
+        into one index, and checkpointed, on reconciliation.
+        """
+        state = self.previous_states[table]
+        cycles = state['cycles'] + 1
+        column = self.mysql_reader.get_leading_column(table)
+
+        if cycles >= self._table_config(table).get('reconcile_every', 10):
+            print(f"{datetime.now()} - Running full reconciliation of {table}")
+            previous_state = {'index': self._state_index(table, 'watermark', state)}
+            changes, checksum, current_state = self._detect_full_changes(table, previous_state)
+            watermark = max(state['watermark'], max(changes.rows.column(column), default=state['watermark']))
+            return changes, checksum, {
+                'index': current_state['index'],
+                'appended': KeyDigestsBuilder(self._key_size(table)),
+                'appended_count': 0,
+                'watermark': watermark,
+                'checksum': checksum,
+                'cycles': 0
+            }
+
+        new_rows = self.mysql_reader.get_rows_above(table, state['watermark'])
+        new_digests = self.mysql_reader.hash_rows(new_rows)
+        new_keys = self.mysql_reader.get_key_codec(table).pack_rows(new_rows)
+        changes = Changes(new_rows, self.mysql_reader.get_key_codec(table), inserted=array('q', range(len(new_rows))))
+        watermark = max(state['watermark'], max(new_rows.column(column), default=state['watermark']))
+
+        # Chain the new rows onto the last full checksum
+        checksum = state['checksum']
+        if len(new_rows):
+            checksum = hashlib.sha256(checksum.encode() + b''.join(new_digests)).hexdigest()
+
+        # New keys are all above the mark and fetched in key order, so they sort last.
+        # Pairs left over from a cycle whose apply failed are dropped first.
+        appended = state['appended']
+        appended.truncate(state['appended_count'])
+        for key, digest in zip(new_keys, new_digests):
+            appended.write(key, digest)
+        return changes, checksum, {
+            'index': state['index'],
+            'appended': appended,
+            'appended_count': len(appended),
+            'watermark': watermark,
+            'checksum': checksum,
+            'cycles': cycles
+        }
+
+    def _detect_stream_changes(self, table):
+        """Detect changes with a merge-join over the stored snapshot file.
+
+        Memory stays flat regardless of table size: rows are streamed from
+        MySQL in key order and only the changed ones are kept. The returned
+        writer holds the new snapshot until it is committed.
+        """
+        writer = self.snapshot_store.writer(table, self._key_size(table))
         try:
-            for table in self.monitored_tables:
-                print(f"{datetime.now()} - Checking table: {table}")
-                
-                # Get current state
-                current_metadata = self.mysql_reader.get_table_metadata(table)
-                current_data = current_metadata['data']
-                
-                # Get previous state
-                previous_data = self.previous_states.get(table, [])
-                
-                # Detect changes
-                changes = self.mysql_reader.compare_data(table, previous_data, current_data)
-                
-                # If there are any changes
-                total_changes = len(changes['inserted']) + len(changes['updated']) + len(changes['deleted'])
-                if total_changes > 0:
-                    print(f"{datetime.now()} - Found {total_changes} changes in {table}")
-                    print(f"Inserts: {len(changes['inserted'])}")
-                    print(f"Updates: {len(changes['updated'])}")
-                    print(f"Deletes: {len(changes['deleted'])}")
-                    
-                    # Apply changes in batches
-                    self.postgres_writer.apply_changes(table, changes, current_metadata['checksum'])
-                
-                # Update previous state
-                self.previous_states[table] = current_data
-                
+            changes = self.mysql_reader.compare_stream(
+                table,
+                self.snapshot_store.read(table, self._key_size(table)),
+                self.mysql_reader.iter_table_data(table, self.batch_size),
+                writer
+            )
+        except Exception:
+            writer.discard()
+            raise
+        return changes, writer.checksum(), writer
+
+    def _detect_range_changes(self, table):
+        """Detect changes by comparing per-range checksums computed in MySQL.
+
+        Only the ranges whose checksum differs from the stored one are
+        fetched and compared row by row.
+        """
+        previous_state = self.previous_states.get(table, {'checksums': {}, 'chunks': {}})
+        previous_checksums = previous_state['checksums']
+        current_checksums = self.mysql_reader.get_range_checksums(table, self.chunk_size)
+        chunks = dict(previous_state['chunks'])
+        codec = self.mysql_reader.get_key_codec(table)
+        schema = self.mysql_reader.get_schema(table)
+
+        changed_chunks = sorted(
+            chunk_no for chunk_no in set(current_checksums) | set(previous_checksums)
+            if current_checksums.get(chunk_no) != previous_checksums.get(chunk_no)
+        )
+        changes = Changes(schema.rowset(), codec)
+        for chunk_no in changed_chunks:
+            current_rows = schema.rowset()
+            if chunk_no in current_checksums:
+                lower = chunk_no * self.chunk_size
+                current_rows = self.mysql_reader.get_range_data(table, lower, lower + self.chunk_size)
+            current_digests = self.mysql_reader.hash_rows(current_rows)
+            current_keys = codec.pack_rows(current_rows)
+            chunk_changes = self.mysql_reader.compare_data(
+                table, chunks.get(chunk_no, KeyDigests(codec.size)), current_rows, current_digests, current_keys
+            )
+            # Only the changed rows of the range are copied
+            changes.extend(chunk_changes)
+            if len(current_rows):
+                chunks[chunk_no] = self.mysql_reader.index_rows(table, current_keys, current_digests)
+            else:
+                chunks.pop(chunk_no, None)
+
+        if changed_chunks:
+            print(f"{datetime.now()} - {len(changed_chunks)} of {len(current_checksums)} ranges changed in {table}")
+
+        checksum = self.mysql_reader.combine_checksums(current_checksums)
+        return changes, checksum, {'checksums': current_checksums, 'chunks': chunks}
+
+    def _ordered_tables(self):
+        """Order tables so dependencies come first and higher priorities go earlier."""
+        remaining = sorted(self.monitored_tables, key=lambda t: -self.table_priorities.get(t, 0))
+        ordered = []
+        while remaining:
+            for table in remaining:
+                dependencies = self.table_dependencies.get(table, [])
+                if all(d in ordered or d not in self.monitored_tables for d in dependencies):
+                    break
+            else:
+                raise ValueError(f"Circular table dependencies among: {remaining}")
+            ordered.append(table)
+            remaining.remove(table)
+        return ordered
+
+    def _tables_to_sync(self, tables=None):
+        """Ordered tables to sync: all monitored tables, or the requested ones.
+
+        Dependencies that were not requested are not pulled in, so each
+        table keeps its own poll interval; the scheduler brings them
+        forward instead when a table depending on them changes. A table
+        whose dependency is backing off after an error is left out and
+        postponed until that dependency is polled again.
+        """
+        if tables is None:
+            return self._ordered_tables()
+
+        ordered, skipped = [], set()
+        for table in self._ordered_tables():
+            if table not in tables:
+                continue
+            blocking = [
+                d for d in self.table_dependencies.get(table, [])
+                if d in skipped or (d not in tables and d in self.monitored_tables
+                                    and self.scheduler is not None and self.scheduler.backing_off(d))
+            ]
+            if blocking:
+                skipped.add(table)
+                self._postpone(table, blocking[0])
+            else:
+                ordered.append(table)
+        return ordered
+
+    def _postpone(self, table, dependency):
+        """Leave a table out of this cycle because a dependency of it is failing."""
+        print(f"{datetime.now()} - Skipping {table} until {dependency} syncs again")
+        if self.scheduler is not None:
+            self.scheduler.postpone(table, dependency)
+
+    def _sync_table(self, table, dependencies=()):
+        """Sync one table and report the outcome to the scheduler."""
+        try:
+            with metrics.table_cycle(table, phase='sync', strategy=self._strategy(table)) as cycle:
+                changes_count, scan_seconds = self._sync_table_changes(table, dependencies)
+                cycle['changes'] = changes_count
+        except Exception:
+            if self.scheduler is not None:
+                self.scheduler.record_error(table)
+            raise
+        if self.scheduler is not None:
+            self.scheduler.record_success(table, changes_count, scan_seconds)
+            if changes_count > 0:
+                # New rows may reference rows its dependencies have not replicated yet
+                for dependency in self.table_dependencies.get(table, []):
+                    if dependency in self.monitored_tables:
+                        self.scheduler.bring_forward(dependency)
+
+    def _sync_table_changes(self, table, dependencies=()):
+        """Detect the changes of one table and apply them.
+
+        dependencies are futures of tables whose changes must reach Postgres
+        first. They are waited on once this table's diff is ready, or before
+        its read when it goes through the pipeline. Returns the number of
+        changes and the seconds spent detecting them.
+        """
+        print(f"{datetime.now()} - Checking table: {table}")
+        strategy = self._strategy(table)
+        if self.pipeline is not None and strategy in ('full', 'stream'):
+            return self._sync_table_pipelined(table, strategy, dependencies)
+        started = time.monotonic()
+        
+        # Detect changes against the previous state
+        if strategy == 'range':
+            changes, checksum, current_state = self._detect_range_changes(table)
+        elif strategy == 'watermark':
+            changes, checksum, current_state = self._detect_watermark_changes(table)
+        elif strategy == 'stream':
+            changes, checksum, current_state = self._detect_stream_changes(table)
+        else:
+            changes, checksum, current_state = self._detect_full_changes(table)
+        scan_seconds = time.monotonic() - started
+        row_count = self._row_count(strategy, current_state)
+        
+        # If there are any changes
+        total_changes = len(changes)
+        metrics.inc('cdc_rows_changed_total', total_changes, table)
+        if total_changes > 0:
+            print(f"{datetime.now()} - Found {total_changes} changes in {table}")
+            print(f"Inserts: {len(changes.inserted)}")
+            print(f"Updates: {len(changes.updated)}")
+            print(f"Deletes: {len(changes.deleted)}")
+            
+            # Apply changes in batches
+            try:
+                with metrics.span('wait_dependencies', table):
+                    for dependency in dependencies:
+                        dependency.result()
+                watermark = current_state['watermark'] if strategy == 'watermark' else None
+                with metrics.span('apply', table):
+                    self.postgres_writer.apply_changes(table, changes, checksum, watermark=watermark,
+                                                      row_count=row_count)
+                for sink in self.sinks:
+                    sink.publish(table, changes)
+            except Exception:
+                if strategy == 'stream':
+                    current_state.discard()
+                raise
+        else:
+            # Nothing to apply; still record the sync so mirror readers see a current lag
+            self.postgres_writer.mark_synced(table, row_count)
+        
+        # Update previous state, checkpointing it once its changes have landed
+        if strategy == 'stream':
+            current_state.commit()
+        else:
+            self.previous_states[table] = current_state
+            if strategy == 'watermark':
+                # Rewriting the whole checkpoint costs as much as the full scan it follows
+                if current_state['cycles'] == 0:
+                    self._save_checkpoint(table, self._state_index(table, strategy, current_state))
+            elif total_changes > 0:
+                self._save_checkpoint(table, self._state_index(table, strategy, current_state))
+
+        return total_changes, scan_seconds
+
+    def _sync_table_pipelined(self, table, strategy, dependencies=()):
+        """Sync a full or stream table through the pipeline, applying its changes batch by batch.
+
+        The new state is only kept, and the sync only recorded in
+        cdc.sync_status, once every batch has been applied. After a failure
+        the next cycle diffs against the old state again, so batches that
+        did land are simply applied once more.
+        """
+        key_size = self._key_size(table)
+        if strategy == 'stream':
+            previous_records = self.snapshot_store.read(table, key_size)
+            output = self.snapshot_store.writer(table, key_size)
+        else:
+            previous_records = self.previous_states.get(table, {'index': KeyDigests(key_size)})['index'].items()
+            output = KeyDigestsBuilder(key_size)
+
+        try:
+            counts = self.pipeline.run(table, previous_records, output, dependencies)
+        except Exception:
+            if strategy == 'stream':
+                output.discard()
+            raise
+
+        total_changes = counts['inserted'] + counts['updated'] + counts['deleted']
+        metrics.inc('cdc_rows_changed_total', total_changes, table)
+        if total_changes > 0:
+            print(f"{datetime.now()} - Applied {total_changes} changes to {table}")
+            print(f"Inserts: {counts['inserted']}")
+            print(f"Updates: {counts['updated']}")
+            print(f"Deletes: {counts['deleted']}")
+
+        if strategy == 'stream':
+            checksum, row_count = output.checksum(), output.count
+        else:
+            index = output.build()
+            checksum, row_count = self.mysql_reader.combine_digests(index.digest_list()), len(index)
+        if total_changes > 0:
+            self.postgres_writer.record_sync(table, row_count, checksum)
+        else:
+            self.postgres_writer.mark_synced(table, row_count)
+
+        if strategy == 'stream':
+            output.commit()
+        else:
+            self.previous_states[table] = {'index': index}
+            if total_changes > 0:
+                self._save_checkpoint(table, index)
+
+        return total_changes, counts['scan_seconds']
+
+    def detect_and_sync(self, tables=None):
+        """Detect changes in the given tables (all monitored tables by default) and sync them.
+
+        With consistent_snapshot every table is read from one MySQL snapshot,
+        so a registration is never replicated without the rows it references.
+        """
+        try:
+            if self.consistent_snapshot:
+                with self.mysql_reader.consistent_snapshot():
+                    self._sync_tables(tables)
+            else:
+                self._sync_tables(tables)
         except Exception as e:
             print(f"Error in detect_and_sync: {str(e)}")
             raise
 
+    def _sync_tables(self, tables=None):
+        """Sync tables sequentially or on the worker pool.
+
+        With more than one worker each table runs on its own thread (and so
+        its own pooled connection to each database), so a cycle takes about
+        as long as the slowest table.
+        """
+        if self.max_workers <= 1:
+            # A failed table does not stop the others, so they are still
+            # rescheduled; only the tables depending on it are skipped
+            errors, failed = [], set()
+            for table in self._tables_to_sync(tables):
+                blocking = [d for d in self.table_dependencies.get(table, []) if d in failed]
+                if blocking:
+                    failed.add(table)
+                    self._postpone(table, blocking[0])
+                    continue
+                try:
+                    self._sync_table(table)
+                except Exception as e:
+                    print(f"{datetime.now()} - Error syncing {table}: {str(e)}")
+                    errors.append(e)
+                    failed.add(table)
+            if errors:
+                raise errors[0]
+            return
+
+        futures = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='cdc-sync') as executor:
+            # Tables are submitted dependencies-first, so a worker waiting on
+            # a dependency always waits on a task that is already running
+            for table in self._tables_to_sync(tables):
+                dependencies = [futures[d] for d in self.table_dependencies.get(table, []) if d in futures]
+                futures[table] = executor.submit(self._sync_table, table, dependencies)
+
+        for table, future in futures.items():
+            future.result()
+
+    def _run_scheduled(self):
+        """Sync the tables that are due and sleep until the next one is."""
+        due_tables = self.scheduler.due_tables()
+        if due_tables:
+            try:
+                self.detect_and_sync(due_tables)
+            except Exception as e:
+                # The scheduler has already backed off the failed tables
+                print(f"Error in CDC loop: {str(e)}")
+            print(f"{datetime.now()} - Poll intervals: {self.scheduler.intervals()}")
+        time.sleep(self.scheduler.seconds_until_next())
+
     def run(self, interval_seconds):
-        """Run the change detection continuously."""
+        """Run the change detection continuously.
+
+        With a scheduler each table is polled on its own adaptive interval,
+        otherwise every table is polled every interval_seconds.
+        """
         self.initialize()
         
         while True:
+            if self.scheduler is not None:
+                self._run_scheduled()
+                continue
             try:
                 self.detect_and_sync()
                 time.sleep(interval_seconds)
@@ -0,0 +1,171 @@
+import threading
+from datetime import date, datetime, timedelta
+from sqlalchemy import text
+
+CDC_COLUMNS = ('cdc_operation', 'cdc_timestamp', 'cdc_checksum')
+
+class ChangeHistory:
+    """Append-only history of mirrored rows, kept in cdc.<table>_history.
+
+    A history row is a version of a mirrored row that a later change
+    replaced or deleted. It holds the version's values and checksum, the
+    time it became current (cdc_valid_from), and the operation ('U' or
+    'D') and cdc_timestamp of the change that ended it. The live cdc.<table>
+    holds the current versions, so a version is valid from cdc_valid_from
+    until cdc_timestamp and the two tables together hold every version.
+
+    History is range-partitioned by cdc_timestamp into one partition per
+    day, created as changes arrive. Partitions older than retention_days
+    are dropped, which never changes the state of a table as of a later
+    time: a dropped partition only held versions that had already ended.
+    """
+
+    def __init__(self, engine, retention_days=30):
+        self.engine = engine
+        self.retention_days = retention_days
+        self._columns = {}
+        self._tables = set()
+        self._partitions = set()
+        self._lock = threading.Lock()
+
+    def columns(self, table_name):
+        """Source columns of cdc.<table> in ordinal order, without the CDC columns."""
+        if table_name not in self._columns:
+            with self.engine.connect() as connection:
+                rows = connection.execute(text("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = 'cdc' AND table_name = :table_name
+                ORDER BY ordinal_position
+                """), {'table_name': table_name})
+                self._columns[table_name] = [row[0] for row in rows if row[0] not in CDC_COLUMNS]
+        return self._columns[table_name]
+
+    def _partition(self, table_name, day):
+        return f"{table_name}_history_p{day:%Y%m%d}"
+
+    def _ensure_table(self, table_name, key_columns):
+        """Create cdc.<table>_history and the indexes point-in-time reads use."""
+        with self.engine.begin() as connection:
+            connection.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS cdc.{table_name}_history (
+                LIKE cdc.{table_name},
+                cdc_valid_from TIMESTAMP NOT NULL
+            ) PARTITION BY RANGE (cdc_timestamp)
+            """))
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {table_name}_history_key_idx "
+                f"ON cdc.{table_name}_history ({', '.join(key_columns)}, cdc_timestamp)"
+            ))
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {table_name}_history_valid_from_idx "
+                f"ON cdc.{table_name}_history (cdc_valid_from)"
+            ))
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {table_name}_cdc_timestamp_idx ON cdc.{table_name} (cdc_timestamp)"
+            ))
+
+    def prepare(self, table_name, key_columns, cdc_timestamp):
+        """Make sure the history of a table can take changes made at cdc_timestamp.
+
+        Creating a day's partition also drops the partitions that expired.
+        """
+        day = cdc_timestamp.date()
+        with self._lock:
+            if table_name not in self._tables:
+                self._ensure_table(table_name, key_columns)
+                self._tables.add(table_name)
+            if (table_name, day) in self._partitions:
+                return
+            with self.engine.begin() as connection:
+                connection.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS cdc.{self._partition(table_name, day)}
+                PARTITION OF cdc.{table_name}_history
+                FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')
+                """))
+            self._partitions.add((table_name, day))
+            self.drop_expired(table_name)
+
+    def _partition_days(self, connection, table_name):
+        """Days of the existing partitions of a table's history, oldest first."""
+        rows = connection.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_namespace ON pg_namespace.oid = parent.relnamespace
+        WHERE pg_namespace.nspname = 'cdc' AND parent.relname = :parent
+        """), {'parent': f"{table_name}_history"})
+        prefix = f"{table_name}_history_p"
+        return sorted(datetime.strptime(row[0][len(prefix):], '%Y%m%d').date()
+                      for row in rows if row[0].startswith(prefix))
+
+    def drop_expired(self, table_name):
+        """Drop the history partitions of a table that lie wholly before the retention period."""
+        if not self.retention_days:
+            return
+        cutoff = date.today() - timedelta(days=self.retention_days)
+        with self.engine.begin() as connection:
+            for day in self._partition_days(connection, table_name):
+                if day + timedelta(days=1) <= cutoff:
+                    connection.execute(text(f"DROP TABLE IF EXISTS cdc.{self._partition(table_name, day)}"))
+                    self._partitions.discard((table_name, day))
+                    print(f"{datetime.now()} - Dropped history of {table_name} for {day}")
+
+    def record_replaced(self, connection, table_name, staging_table, key_columns):
+        """Append the current versions of the staged rows that the staged values change.
+
+        Must run before the staged rows are merged into cdc.<table>.
+        """
+        columns = self.columns(table_name)
+        connection.execute(text(f"""
+        INSERT INTO cdc.{table_name}_history ({', '.join(columns)}, {', '.join(CDC_COLUMNS)}, cdc_valid_from)
+        SELECT {', '.join(f"live.{c}" for c in columns)}, 'U', staged.cdc_timestamp, live.cdc_checksum,
+               live.cdc_timestamp
+        FROM cdc.{table_name} AS live
+        JOIN {staging_table} AS staged ON {' AND '.join(f"staged.{c} = live.{c}" for c in key_columns)}
+        WHERE ({', '.join(f"live.{c}" for c in columns)}) IS DISTINCT FROM
+              ({', '.join(f"staged.{c}" for c in columns)})
+        """))
+
+    def record_deleted_sql(self, table_name, deleted):
+        """SQL appending the rows RETURNING'd by the CTE deleted as versions ended by a delete."""
+        columns = self.columns(table_name)
+        return f"""
+        INSERT INTO cdc.{table_name}_history ({', '.join(columns)}, {', '.join(CDC_COLUMNS)}, cdc_valid_from)
+        SELECT {', '.join(columns)}, 'D', :cdc_timestamp, cdc_checksum, cdc_timestamp FROM {deleted}
+        """
+
+    def as_of(self, table_name, at, key=None):
+        """Rows of a table as they were at time at, optionally only the row with key {column: value}.
+
+        Current rows unchanged since at come from cdc.<table>; rows changed
+        since come from the history partitions after at, through the
+        cdc_valid_from index, so the cost follows the changes made since at
+        rather than the size of the history.
+
+        Before any history is kept, the current rows answer for any time
+        since the table's last sync, as nothing has replaced them since.
+        """
+        columns = self.columns(table_name)
+        with self.engine.connect() as connection:
+            days = self._partition_days(connection, table_name)
+            horizon = datetime.combine(days[0], datetime.min.time()) if days else None
+            if horizon is None or at < horizon:
+                last_sync = connection.execute(text(
+                    "SELECT last_success_sync_time FROM cdc.sync_status WHERE table_name = :table_name"
+                ), {'table_name': table_name}).scalar()
+                if last_sync is None or at < last_sync:
+                    raise ValueError(f"History of {table_name} does not reach back to {at}")
+
+            key = key or {}
+            key_filter = ''.join(f" AND {c} = :key_{c}" for c in key)
+            params = {'at': at, **{f"key_{c}": value for c, value in key.items()}}
+            sql = f"SELECT {', '.join(columns)} FROM cdc.{table_name} WHERE cdc_timestamp <= :at{key_filter}"
+            if days:
+                sql += f"""
+                UNION ALL
+                SELECT {', '.join(columns)} FROM cdc.{table_name}_history
+                WHERE cdc_timestamp > :at AND cdc_valid_from <= :at{key_filter}
+                """
+            rows = connection.execute(text(sql), params)
+            return [dict(row._mapping) for row in rows]
@@ -0,0 +1,119 @@
+from datetime import date, datetime
+import struct
+
+# Integers are stored offset by 2**63 so their unsigned big-endian bytes sort like the numbers
+INT_OFFSET = 1 << 63
+
+INTEGER_TYPES = {'tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint'}
+STRING_TYPES = {'char', 'varchar'}
+BINARY_TYPES = {'binary', 'varbinary'}
+TEMPORAL_WIDTHS = {'date': 10, 'datetime': 26, 'timestamp': 26}
+
+# Kinds of key column holding whole numbers
+INTEGER_KINDS = ('int', 'uint')
+
+class KeyCodec:
+    """Packs the primary-key values of a row into fixed-width bytes.
+
+    Every table gets one struct layout: 8 bytes per integer column, the
+    declared byte length (NUL padded) per string column and an ISO string
+    per date or time column. Binary columns are kept as bytes and followed
+    by their 2-byte length, so trailing NULs survive and shorter values
+    still sort first. 'bigint unsigned' columns are stored without the
+    signed offset. Packed keys are cheap to hash and compare, and compare
+    in key order, with strings in binary collation.
+    """
+
+    def __init__(self, columns):
+        """columns is a list of (name, data_type, octet_length) in key order."""
+        self.columns = [name for name, _, _ in columns]
+        self.kinds = []
+        self._lengths = []
+        formats = []
+        for name, data_type, octet_length in columns:
+            data_type = data_type.lower()
+            length = int(octet_length or 0)
+            if data_type == 'bigint unsigned':
+                self.kinds.append('uint')
+                formats.append('Q')
+            elif data_type in INTEGER_TYPES:
+                self.kinds.append('int')
+                formats.append('Q')
+            elif data_type in STRING_TYPES:
+                self.kinds.append('str')
+                formats.append(f"{length}s")
+            elif data_type in BINARY_TYPES:
+                if not 0 < length < 1 << 16:
+                    raise ValueError(f"Unsupported length {octet_length} of binary primary key column {name}")
+                self.kinds.append('bytes')
+                formats.append(f"{length + 2}s")
+            elif data_type in TEMPORAL_WIDTHS:
+                self.kinds.append(data_type)
+                formats.append(f"{TEMPORAL_WIDTHS[data_type]}s")
+            else:
+                raise ValueError(f"Unsupported primary key column {name} of type {data_type}")
+            self._lengths.append(length)
+        self._struct = struct.Struct('>' + ''.join(formats))
+        self.size = self._struct.size
+
+        if self.kinds == ['int']:
+            # Fast path for the common single integer key
+            column = self.columns[0]
+            pack_int = struct.Struct('>Q').pack
+            self.pack = lambda row: pack_int(row[column] + INT_OFFSET)
+            self.pack_rows = lambda rows: [pack_int(value + INT_OFFSET) for value in rows.column(column)]
+
+    @property
+    def is_integer(self):
+        """Whether the key is one integer column, as watermark capture needs."""
+        return len(self.kinds) == 1 and self.kinds[0] in INTEGER_KINDS
+
+    def _encode(self, kind, length, value):
+        if kind == 'int':
+            return value + INT_OFFSET
+        if kind == 'uint':
+            return value
+        if kind == 'str':
+            return value if isinstance(value, bytes) else value.encode()
+        if kind == 'bytes':
+            return bytes(value).ljust(length, b'\0') + len(value).to_bytes(2, 'big')
+        if kind == 'date':
+            return value.isoformat().encode()
+        return value.isoformat(' ').encode()
+
+    def _decode(self, kind, length, value):
+        if kind == 'int':
+            return value - INT_OFFSET
+        if kind == 'uint':
+            return value
+        if kind == 'bytes':
+            return value[:int.from_bytes(value[length:], 'big')]
+        value = value.rstrip(b'\0').decode()
+        if kind == 'date':
+            return date.fromisoformat(value)
+        if kind in ('datetime', 'timestamp'):
+            return datetime.fromisoformat(value)
+        return value
+
+    def pack(self, row):
+        """Packed key of a row."""
+        return self._struct.pack(*(self._encode(kind, length, row[name])
+                                   for name, kind, length in zip(self.columns, self.kinds, self._lengths)))
+
+    def pack_rows(self, rows):
+        """Packed keys of every row of a RowSet, in row order."""
+        columns = [rows.column(name) for name in self.columns]
+        return [self._struct.pack(*(self._encode(kind, length, value)
+                                    for kind, length, value in zip(self.kinds, self._lengths, values)))
+                for values in zip(*columns)]
+
+    def leading_int(self, key):
+        """Value of the leading integer key column of a packed key."""
+        value = int.from_bytes(key[:8], 'big')
+        return value if self.kinds[0] == 'uint' else value - INT_OFFSET
+
+    def unpack(self, key):
+        """Row holding only the key columns of a packed key."""
+        values = self._struct.unpack(key)
+        return {name: self._decode(kind, length, value)
+                for name, kind, length, value in zip(self.columns, self.kinds, self._lengths, values)}
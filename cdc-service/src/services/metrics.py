@@ -0,0 +1,195 @@
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+# Upper bounds in seconds of the stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+COUNTER_HELP = {
+    'cdc_rows_scanned_total': 'Rows read from MySQL',
+    'cdc_rows_changed_total': 'Inserted, updated and deleted rows found',
+    'cdc_bytes_fetched_total': 'Bytes MySQL sent to the service, mostly result rows',
+    'cdc_retries_total': 'Retried MySQL reads',
+    'cdc_sync_errors_total': 'Failed table syncs',
+    'cdc_backfill_rows_total': 'Rows copied to Postgres by the initial backfill',
+    'cdc_verify_divergent_rows_total': 'Rows found to differ between MySQL and Postgres by verification',
+    'cdc_sink_events_total': 'Change events delivered to sinks',
+    'cdc_sink_events_dropped_total': 'Change events dropped by sinks too far behind'
+}
+
+GAUGE_HELP = {
+    'cdc_pipeline_fetched_depth': 'Batches read from MySQL waiting to be diffed',
+    'cdc_pipeline_diffed_depth': 'Change batches waiting to be applied to Postgres'
+}
+
+class Metrics:
+    """Process-wide counters and stage timings for the CDC service.
+
+    Counters and the stage duration histogram are labelled by table, which
+    defaults to the table of the thread's current table_cycle or
+    table_label block. Stages timed inside a table_cycle block are also
+    collected into that cycle's record, which is logged as one JSON line
+    when json_logs is set.
+    """
+
+    def __init__(self, json_logs=False):
+        self.json_logs = json_logs
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._durations = {}
+        self._local = threading.local()
+
+    def _current_cycle(self):
+        return getattr(self._local, 'cycle', None)
+
+    def _table(self, table):
+        if table is not None:
+            return table
+        cycle = self._current_cycle()
+        if cycle is not None:
+            return cycle['table']
+        return getattr(self._local, 'table', '')
+
+    def inc(self, name, value=1, table=None):
+        """Add value to a counter; table defaults to the table of the current cycle."""
+        key = (name, self._table(table))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        cycle = self._current_cycle()
+        if cycle is not None:
+            counters = cycle['counters']
+            counters[name] = counters.get(name, 0) + value
+
+    def set_gauge(self, name, value, table=None):
+        """Set a gauge to its current value."""
+        with self._lock:
+            self._gauges[(name, self._table(table))] = value
+
+    def observe(self, stage, seconds, table=None):
+        """Record the duration of one stage run."""
+        key = (stage, self._table(table))
+        with self._lock:
+            histogram = self._durations.get(key)
+            if histogram is None:
+                histogram = self._durations[key] = {'buckets': [0] * len(DURATION_BUCKETS), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+        cycle = self._current_cycle()
+        if cycle is not None:
+            stages = cycle['stages']
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def span(self, stage, table=None):
+        """Time the enclosed block as one run of stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, table)
+
+    @contextmanager
+    def table_cycle(self, table, **fields):
+        """Collect the stages and counters of one sync of a table.
+
+        Yields the cycle record; callers may add fields to it. It is logged
+        as a JSON line when the block exits.
+        """
+        cycle = {'table': table, 'stages': {}, 'counters': {}, **fields}
+        self._local.cycle = cycle
+        started = time.perf_counter()
+        try:
+            yield cycle
+        except Exception as e:
+            cycle['error'] = str(e)
+            self.inc('cdc_sync_errors_total', table=table)
+            raise
+        finally:
+            self._local.cycle = None
+            cycle['seconds'] = round(time.perf_counter() - started, 6)
+            if self.json_logs:
+                self.log('table_synced', **cycle)
+
+    @contextmanager
+    def table_label(self, table):
+        """Label what the current thread records with table.
+
+        For threads doing part of a table's sync outside the thread that
+        runs its table_cycle, such as the pipeline's read and diff stages.
+        """
+        self._local.table = table
+        try:
+            yield
+        finally:
+            self._local.table = ''
+
+    def log(self, event, **fields):
+        """Write one structured log line to stdout."""
+        print(json.dumps({'ts': datetime.now().isoformat(), 'event': event, **fields}, default=str), flush=True)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            durations = {key: {'buckets': list(h['buckets']), 'sum': h['sum'], 'count': h['count']}
+                         for key, h in self._durations.items()}
+
+        lines = []
+        for name, help_text in COUNTER_HELP.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (counter, table), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f'{name}{{table="{table}"}} {value}')
+
+        for name, help_text in GAUGE_HELP.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for (gauge, table), value in sorted(gauges.items()):
+                if gauge == name:
+                    lines.append(f'{name}{{table="{table}"}} {value}')
+
+        lines.append("# HELP cdc_stage_duration_seconds Time spent per sync stage")
+        lines.append("# TYPE cdc_stage_duration_seconds histogram")
+        for (stage, table), histogram in sorted(durations.items()):
+            labels = f'stage="{stage}",table="{table}"'
+            for bound, count in zip(DURATION_BUCKETS, histogram['buckets']):
+                lines.append(f'cdc_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'cdc_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+            lines.append(f'cdc_stage_duration_seconds_sum{{{labels}}} {histogram["sum"]:.6f}')
+            lines.append(f'cdc_stage_duration_seconds_count{{{labels}}} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port):
+        """Serve /metrics over HTTP from a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(('', port), Handler)
+        threading.Thread(target=server.serve_forever, name='cdc-metrics', daemon=True).start()
+        return server
+
+# Shared by the reader, writer and detector
+metrics = Metrics()
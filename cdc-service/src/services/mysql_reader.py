@@ -1,25 +1,88 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy import types as sqltypes
+from contextlib import contextmanager
 import hashlib
-import json
+import threading
 import time
+from xxhash import xxh3_128_digest
+from models import Changes, KeyDigests, TableSchema
+from services.metrics import metrics
+from services.key_codec import INTEGER_KINDS, INTEGER_TYPES, KeyCodec
 
 class MySQLReader:
-    def __init__(self, connection_string):
+    def __init__(self, connection_string, primary_keys=None):
         self.engine = create_engine(connection_string, pool_recycle=3600, pool_pre_ping=True)
+        self.primary_keys = primary_keys or {}
+        self._schemas = {}
+        self._key_codecs = {}
+        self._snapshot_connection = None
+        self._snapshot_lock = threading.Lock()
+
+    @contextmanager
+    def consistent_snapshot(self):
+        """Serve every read inside the block from one consistent snapshot.
+
+        All tables are read as of the same instant, on a single pooled
+        connection with unbuffered cursors. The connection is shared by all
+        threads, so reads are serialized while the block is active.
+        """
+        with self.engine.connect() as connection:
+            connection.exec_driver_sql("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+            self._snapshot_connection = connection.execution_options(stream_results=True)
+            try:
+                yield
+            finally:
+                self._snapshot_connection = None
+                connection.exec_driver_sql("ROLLBACK")
+
+    def _bytes_sent(self, connection):
+        """Bytes the MySQL server has sent on this session so far, or None on other databases.
+
+        Bytes_sent is counted by the server, so it covers the result rows
+        fetched; its Bytes_received only counts the queries we send.
+        """
+        if connection.dialect.name != 'mysql':
+            return None
+        row = connection.exec_driver_sql("SHOW SESSION STATUS LIKE 'Bytes_sent'").first()
+        return int(row[1])
+
+    def _fetch(self, connection, sql, params=None, schema=None):
+        """Run a query on a connection and record its rows, bytes and duration.
+
+        With a schema the rows come back as a RowSet, otherwise as dicts.
+        """
+        with metrics.span('select'):
+            bytes_before = self._bytes_sent(connection)
+            result = connection.execute(text(sql), params or {})
+            if schema is None:
+                rows = [dict(row) for row in result]
+            else:
+                rows = schema.rowset(result.keys())
+                for partition in result.partitions(10000):
+                    rows.extend(partition)
+            if bytes_before is not None:
+                metrics.inc('cdc_bytes_fetched_total', self._bytes_sent(connection) - bytes_before)
+        metrics.inc('cdc_rows_scanned_total', len(rows))
+        return rows
+
+    def _query(self, table_name, sql, params=None, max_retries=3, schema=None):
+        """Run a read-only query against a table with retries."""
+        if self._snapshot_connection is not None:
+            # A retry on a new connection would leave the snapshot, so fail instead
+            with self._snapshot_lock:
+                return self._fetch(self._snapshot_connection, sql, params, schema)
 
-    def get_table_data(self, table_name, max_retries=3):
-        """Fetch all data from a table with retries."""
         retry_count = 0
         last_error = None
         
         while retry_count < max_retries:
             try:
                 with self.engine.connect() as connection:
-                    result = connection.execute(text(f"SELECT * FROM {table_name}"))
-                    return [dict(row) for row in result]
+                    return self._fetch(connection, sql, params, schema)
             except Exception as e:
                 last_error = e
                 retry_count += 1
+                metrics.inc('cdc_retries_total', table=table_name)
                 print(f"Error reading table {table_name}: {str(e)}. Retry {retry_count}/{max_retries}")
                 if retry_count < max_retries:
                     time.sleep(2)  # Wait before retrying
@@ -27,52 +90,413 @@ class MySQLReader:
         # If we get here, all retries failed
         raise Exception(f"Failed to read table {table_name} after {max_retries} attempts: {str(last_error)}")
 
-    def calculate_checksum(self, row):
-        """Calculate a checksum for a row."""
-        # Sort keys to ensure consistent ordering
-        ordered_data = {k: str(row[k]) for k in sorted(row.keys())}
-        json_str = json.dumps(ordered_data, sort_keys=True)
-        return hashlib.sha256(json_str.encode()).hexdigest()
+    def check_table(self, table_name):
+        """Read one row of a table, to check that it exists and can be read."""
+        return self._query(table_name, f"SELECT * FROM {table_name} LIMIT 1")
+
+    def get_table_data(self, table_name, max_retries=3):
+        """Fetch all data from a table with retries, as a RowSet."""
+        schema = self.get_schema(table_name)
+        return self._query(table_name, f"SELECT * FROM {table_name}", max_retries=max_retries, schema=schema)
+
+    def iter_table_data(self, table_name, batch_size=1000):
+        """Stream all rows of a table in primary-key order.
+
+        Uses a server-side cursor, so only one batch of rows is held in
+        memory at a time.
+        """
+        sql = text(f"SELECT * FROM {table_name} ORDER BY {self._key_order(table_name)}")
+        if self._snapshot_connection is not None:
+            with self._snapshot_lock:
+                yield from self._stream(self._snapshot_connection, sql, batch_size)
+            return
+
+        with self.engine.connect() as connection:
+            yield from self._stream(connection.execution_options(stream_results=True), sql, batch_size)
+
+    def _stream(self, connection, sql, batch_size):
+        """Yield the rows of a streamed query, recording rows and bytes per batch."""
+        bytes_before = self._bytes_sent(connection)
+        result = connection.execute(sql)
+        for partition in result.partitions(batch_size):
+            metrics.inc('cdc_rows_scanned_total', len(partition))
+            for row in partition:
+                yield dict(row)
+        if bytes_before is not None:
+            metrics.inc('cdc_bytes_fetched_total', self._bytes_sent(connection) - bytes_before)
+
+    def iter_table_batches(self, table_name, batch_size=1000):
+        """Stream all rows of a table in primary-key order as RowSets of up to batch_size rows."""
+        schema = self.get_schema(table_name)
+        sql = text(f"SELECT * FROM {table_name} ORDER BY {self._key_order(table_name)}")
+        if self._snapshot_connection is not None:
+            with self._snapshot_lock:
+                yield from self._stream_batches(self._snapshot_connection, sql, {}, schema, batch_size)
+            return
+
+        with self.engine.connect() as connection:
+            yield from self._stream_batches(connection.execution_options(stream_results=True), sql, {},
+                                            schema, batch_size)
+
+    def iter_range_batches(self, table_name, lower, upper, batch_size=1000):
+        """Stream the rows whose leading key column is in [lower, upper) in key order.
+
+        Rows come as RowSets of up to batch_size rows from a server-side
+        cursor on a connection of their own.
+        """
+        column = self.get_leading_column(table_name)
+        schema = self.get_schema(table_name)
+        sql = text(f"SELECT * FROM {table_name} WHERE {column} >= :lower AND {column} < :upper "
+                   f"ORDER BY {self._key_order(table_name)}")
+        with self.engine.connect() as connection:
+            yield from self._stream_batches(connection.execution_options(stream_results=True), sql,
+                                            {'lower': lower, 'upper': upper}, schema, batch_size)
+
+    def _stream_batches(self, connection, sql, params, schema, batch_size):
+        """Yield the rows of a streamed query as RowSets, recording rows and bytes per batch."""
+        bytes_before = self._bytes_sent(connection)
+        result = connection.execute(sql, params)
+        for partition in result.partitions(batch_size):
+            metrics.inc('cdc_rows_scanned_total', len(partition), schema.name)
+            rows = schema.rowset(result.keys())
+            rows.extend(partition)
+            yield rows
+        if bytes_before is not None:
+            metrics.inc('cdc_bytes_fetched_total', self._bytes_sent(connection) - bytes_before, schema.name)
+
+    def get_key_range(self, table_name):
+        """Lowest and highest value of the leading key column, or (None, None) for an empty table."""
+        column = self.get_leading_column(table_name)
+        row = self._query(table_name, f"SELECT MIN({column}) AS lower, MAX({column}) AS upper FROM {table_name}")[0]
+        return row['lower'], row['upper']
+
+    def get_rows_above(self, table_name, watermark):
+        """Fetch the rows of a table whose primary key is above watermark."""
+        column = self.get_leading_column(table_name)
+        schema = self.get_schema(table_name)
+        sql = f"SELECT * FROM {table_name} WHERE {column} > :watermark ORDER BY {column}"
+        return self._query(table_name, sql, {'watermark': watermark}, schema=schema)
+
+    def get_schema(self, table_name):
+        """Columns of a table in ordinal order and which of them hold integers.
+
+        Unsigned BIGINT values may not fit a signed 64-bit column, so those
+        are not counted as integers.
+        """
+        if table_name not in self._schemas:
+            if self.engine.dialect.name != 'mysql':
+                columns = inspect(self.engine).get_columns(table_name)
+                names = [column['name'] for column in columns]
+                integers = {column['name'] for column in columns if isinstance(column['type'], sqltypes.Integer)}
+            else:
+                rows = self._query(table_name, """
+                    SELECT COLUMN_NAME AS column_name, DATA_TYPE AS data_type, COLUMN_TYPE AS column_type
+                    FROM information_schema.COLUMNS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name
+                    ORDER BY ORDINAL_POSITION
+                """, {'table_name': table_name})
+                names = [row['column_name'] for row in rows]
+                integers = {
+                    row['column_name'] for row in rows
+                    if row['data_type'].lower() in INTEGER_TYPES
+                    and not (row['data_type'].lower() == 'bigint' and 'unsigned' in row['column_type'].lower())
+                }
+            self._schemas[table_name] = TableSchema(table_name, names, integers)
+        return self._schemas[table_name]
+
+    def get_columns(self, table_name):
+        """Get the column names of a table in ordinal order."""
+        return self.get_schema(table_name).columns
+
+    def get_key_codec(self, table_name):
+        """Key layout of a table, from primary_keys or the table's primary key."""
+        if table_name not in self._key_codecs:
+            self._key_codecs[table_name] = KeyCodec(self._describe_key(table_name))
+        return self._key_codecs[table_name]
+
+    def _describe_key(self, table_name):
+        """(name, data_type, octet_length) of each key column, discovered from information_schema.
+
+        Unsigned BIGINT columns are described as 'bigint unsigned', since
+        their values may not fit the signed layout of the other integers.
+        """
+        if self.engine.dialect.name != 'mysql':
+            return self._inspect_key(table_name)
+
+        rows = self._query(table_name, """
+            SELECT COLUMN_NAME AS column_name, DATA_TYPE AS data_type, COLUMN_TYPE AS column_type,
+                   CHARACTER_OCTET_LENGTH AS octet_length
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name
+        """, {'table_name': table_name})
+        types = {}
+        for row in rows:
+            data_type = row['data_type'].lower()
+            if data_type == 'bigint' and 'unsigned' in row['column_type'].lower():
+                data_type = 'bigint unsigned'
+            types[row['column_name']] = (data_type, row['octet_length'])
+
+        key_columns = self.primary_keys.get(table_name)
+        if key_columns is None:
+            rows = self._query(table_name, """
+                SELECT COLUMN_NAME AS column_name
+                FROM information_schema.KEY_COLUMN_USAGE
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name AND CONSTRAINT_NAME = 'PRIMARY'
+                ORDER BY ORDINAL_POSITION
+            """, {'table_name': table_name})
+            key_columns = [row['column_name'] for row in rows]
+        if not key_columns:
+            raise ValueError(f"Table {table_name} has no primary key; set one in MONITORED_TABLES")
+        return [(column, *types[column]) for column in key_columns]
+
+    def _inspect_key(self, table_name):
+        """Key columns through the SQLAlchemy inspector, for databases without information_schema."""
+        inspector = inspect(self.engine)
+        key_columns = self.primary_keys.get(table_name) or inspector.get_pk_constraint(table_name)['constrained_columns']
+        types = {column['name']: column['type'] for column in inspector.get_columns(table_name)}
+        described = []
+        for column in key_columns:
+            column_type = types[column]
+            if isinstance(column_type, sqltypes.Integer):
+                described.append((column, 'bigint', None))
+            elif isinstance(column_type, sqltypes.String):
+                described.append((column, 'varchar', (column_type.length or 255) * 4))
+            elif isinstance(column_type, sqltypes.DateTime):
+                described.append((column, 'datetime', None))
+            elif isinstance(column_type, sqltypes.Date):
+                described.append((column, 'date', None))
+            else:
+                described.append((column, str(column_type), None))
+        return described
+
+    def get_primary_key(self, table_name):
+        """Key columns of a table in key order."""
+        return self.get_key_codec(table_name).columns
+
+    def get_leading_column(self, table_name):
+        """First key column of a table, which ranges and watermarks are taken over."""
+        codec = self.get_key_codec(table_name)
+        if codec.kinds[0] not in INTEGER_KINDS:
+            raise ValueError(f"Range and watermark capture need an integer leading key column in {table_name}")
+        return codec.columns[0]
+
+    def _key_order(self, table_name):
+        """ORDER BY list that sorts rows like their packed keys."""
+        codec = self.get_key_codec(table_name)
+        if self.engine.dialect.name != 'mysql':
+            return ', '.join(codec.columns)
+        # Packed string keys compare bytewise, so sort them in binary collation
+        return ', '.join(column if kind in INTEGER_KINDS else f"CAST({column} AS BINARY)"
+                         for column, kind in zip(codec.columns, codec.kinds))
+
+    def get_range_checksums(self, table_name, chunk_size):
+        """Get a (row_count, checksum) pair for every primary-key range of a table.
+
+        The hashing runs inside MySQL, so only one small row per range is
+        transferred. Ranges are fixed-width buckets of the key, which keeps
+        their boundaries stable between polls.
+        """
+        key_column = self.get_leading_column(table_name)
+        row_expr = self._row_hash_sql(table_name)
+        sql = f"""
+        SELECT
+            FLOOR({key_column} / :chunk_size) AS chunk_no,
+            COUNT(*) AS row_count,
+            BIT_XOR(CAST(CONV(SUBSTRING({row_expr}, 1, 16), 16, 10) AS UNSIGNED)) AS hash_hi,
+            BIT_XOR(CAST(CONV(SUBSTRING({row_expr}, 17, 16), 16, 10) AS UNSIGNED)) AS hash_lo
+        FROM {table_name}
+        GROUP BY chunk_no
+        """
+        rows = self._query(table_name, sql, {'chunk_size': chunk_size})
+        return {
+            int(row['chunk_no']): (int(row['row_count']), f"{int(row['hash_hi']):016x}{int(row['hash_lo']):016x}")
+            for row in rows
+        }
+
+    def _row_hash_sql(self, table_name):
+        """SQL for the MD5 of a row's values as text, matched by PostgresWriter._row_hash_sql."""
+        columns = self.get_columns(table_name)
+        # CONCAT_WS skips NULLs, so append a NULL bitmap to tell NULL and '' apart
+        return "MD5(CONCAT_WS('#', {}, CONCAT({})))".format(
+            ', '.join(f"`{c}`" for c in columns),
+            ', '.join(f"ISNULL(`{c}`)" for c in columns)
+        )
+
+    def checksum_key_range(self, table_name, lower, upper):
+        """(row_count, hash_hi, hash_lo) of the rows whose leading key column is in [lower, upper).
+
+        The two hashes are sums of the first and second 60 bits of each row's
+        MD5, which Postgres can compute identically over the mirror.
+        """
+        column = self.get_leading_column(table_name)
+        row_expr = self._row_hash_sql(table_name)
+        sql = f"""
+        SELECT
+            COUNT(*) AS row_count,
+            COALESCE(SUM(CAST(CONV(SUBSTRING({row_expr}, 1, 15), 16, 10) AS UNSIGNED)), 0) AS hash_hi,
+            COALESCE(SUM(CAST(CONV(SUBSTRING({row_expr}, 16, 15), 16, 10) AS UNSIGNED)), 0) AS hash_lo
+        FROM {table_name}
+        WHERE {column} >= :lower AND {column} < :upper
+        """
+        row = self._query(table_name, sql, {'lower': lower, 'upper': upper})[0]
+        return int(row['row_count']), int(row['hash_hi']), int(row['hash_lo'])
+
+    def get_row_hashes(self, table_name, lower, upper):
+        """Map the key tuple of each row whose leading key column is in [lower, upper) to its row MD5."""
+        codec = self.get_key_codec(table_name)
+        column = self.get_leading_column(table_name)
+        sql = f"""
+        SELECT {', '.join(codec.columns)}, {self._row_hash_sql(table_name)} AS row_hash
+        FROM {table_name}
+        WHERE {column} >= :lower AND {column} < :upper
+        """
+        rows = self._query(table_name, sql, {'lower': lower, 'upper': upper})
+        return {tuple(row[c] for c in codec.columns): row['row_hash'] for row in rows}
+
+    def get_range_data(self, table_name, lower, upper):
+        """Fetch the rows of a table whose leading key column is in [lower, upper)."""
+        column = self.get_leading_column(table_name)
+        schema = self.get_schema(table_name)
+        sql = f"SELECT * FROM {table_name} WHERE {column} >= :lower AND {column} < :upper"
+        return self._query(table_name, sql, {'lower': lower, 'upper': upper}, schema=schema)
+
+    def combine_checksums(self, range_checksums):
+        """Combine per-range checksums into one table checksum."""
+        parts = sorted(f"{chunk_no}:{count}:{checksum}" for chunk_no, (count, checksum) in range_checksums.items())
+        return hashlib.sha256(''.join(parts).encode()).hexdigest()
+
+    def hash_rows(self, rows):
+        """Calculate a 16-byte digest for every row of a RowSet in one columnar pass.
+
+        Values are stringified a whole column at a time and each row is then
+        hashed with XXH3-128, which is much cheaper than JSON plus SHA-256.
+        Every value is prefixed with its length and NULL is written as '-',
+        which no length starts with, so no two rows encode the same.
+        """
+        if not len(rows):
+            return []
+
+        with metrics.span('hash'):
+            return self._hash_columns(rows.values)
+
+    def _hash_columns(self, values):
+        columns = []
+        for column in values:
+            if None in column:
+                columns.append(['-' if value is None else f"{len(string)}:{string}"
+                                for value, string in zip(column, map(str, column))])
+            else:
+                columns.append([f"{len(string)}:{string}" for string in map(str, column)])
+
+        return [xxh3_128_digest(''.join(row).encode()) for row in zip(*columns)]
+
+    def calculate_digest(self, row):
+        """Calculate a compact 16-byte digest for a row given as a dict."""
+        # Called per row, so skip the span of hash_rows
+        return self._hash_columns([[value] for value in row.values()])[0]
+
+    def combine_digests(self, digests):
+        """Combine row digests into one order-independent table checksum."""
+        return hashlib.sha256(b''.join(sorted(digests))).hexdigest()
+
+    def index_rows(self, table_name, keys, digests):
+        """KeyDigests of rows from their packed keys and digests."""
+        return KeyDigests.from_pairs(self.get_key_codec(table_name).size, sorted(zip(keys, digests)))
 
     def get_table_metadata(self, table_name):
-        """Get table metadata including row count and overall checksum."""
+        """Get table metadata: the rows, their packed keys and digests, and an overall checksum."""
         data = self.get_table_data(table_name)
-        row_count = len(data)
-        checksums = sorted(self.calculate_checksum(row) for row in data)
-        overall_checksum = hashlib.sha256(''.join(checksums).encode()).hexdigest()
-        
+        digests = self.hash_rows(data)
+        keys = self.get_key_codec(table_name).pack_rows(data)
+
         return {
-            'row_count': row_count,
-            'checksum': overall_checksum,
-            'data': data
+            'row_count': len(data),
+            'checksum': self.combine_digests(digests),
+            'data': data,
+            'digests': digests,
+            'keys': keys
         }
 
-    def compare_data(self, table_name, previous_data, current_data):
-        """Compare two datasets and return changes."""
-        previous_dict = {self.get_key(row): row for row in previous_data}
-        current_dict = {self.get_key(row): row for row in current_data}
-        
-        # Find changes
-        changes = {
-            'inserted': [],
-            'updated': [],
-            'deleted': []
-        }
-        
-        # Check for inserts and updates
-        for key, current_row in current_dict.items():
-            if key not in previous_dict:
-                changes['inserted'].append(current_row)
-            elif self.calculate_checksum(current_row) != self.calculate_checksum(previous_dict[key]):
-                changes['updated'].append(current_row)
-        
-        # Check for deletes
-        for key in previous_dict:
-            if key not in current_dict:
-                changes['deleted'].append(previous_dict[key])
-        
+    def compare_data(self, table_name, previous, current_rows, current_digests=None, current_keys=None):
+        """Compare the KeyDigests of a previous state with the current rows.
+
+        Digests and packed keys already calculated for the current rows,
+        aligned with them, are reused. The returned Changes point into
+        current_rows instead of copying them.
+        """
+        codec = self.get_key_codec(table_name)
+        if current_digests is None:
+            current_digests = self.hash_rows(current_rows)
+        if current_keys is None:
+            current_keys = codec.pack_rows(current_rows)
+        with metrics.span('compare'):
+            return self._diff(codec, previous, current_rows, current_digests, current_keys)
+
+    def _diff(self, codec, previous, current_rows, current_digests, current_keys):
+        changes = Changes(current_rows, codec)
+        current = {key: index for index, key in enumerate(current_keys)}
+
+        # Check for updates and deletes
+        for key, digest in previous.items():
+            index = current.pop(key, None)
+            if index is None:
+                changes.deleted.append(key)
+            elif current_digests[index] != digest:
+                changes.updated.append(index)
+
+        # Whatever is left was not there before
+        changes.inserted.extend(sorted(current.values()))
         return changes
 
-    def get_key(self, row):
-        """Get the primary key value(s) for a row."""
-        return row['id']  # Adjust if primary key is different
\ No newline at end of file
+    def get_key(self, table_name, row):
+        """Get the packed primary key of a row."""
+        return self.get_key_codec(table_name).pack(row)
+
+    def get_key_row(self, table_name, key):
+        """Build a row holding only the primary key values of a packed key."""
+        return self.get_key_codec(table_name).unpack(key)
+
+    def compare_stream(self, table_name, previous_records, current_rows, snapshot_writer):
+        """Merge-join key-ordered rows against stored (key, digest) records.
+
+        Both inputs must be sorted by packed primary key. Only changed rows are kept;
+        every current (key, digest) pair is written to snapshot_writer so it
+        becomes the next previous state. Deleted rows carry only their key.
+        The whole merge, including reading current_rows, is timed as 'compare'.
+        """
+        # Before the merge starts reading, which may hold the snapshot connection
+        schema = self.get_schema(table_name)
+        with metrics.span('compare'):
+            return self._merge(table_name, schema, previous_records, current_rows, snapshot_writer)
+
+    def _merge(self, table_name, schema, previous_records, current_rows, snapshot_writer):
+        codec = self.get_key_codec(table_name)
+        changes = Changes(schema.rowset(), codec)
+
+        previous = iter(previous_records)
+        previous_record = next(previous, None)
+        for row in current_rows:
+            key = codec.pack(row)
+            digest = self.calculate_digest(row)
+
+            # Stored keys below the current one no longer exist
+            while previous_record is not None and previous_record[0] < key:
+                changes.deleted.append(previous_record[0])
+                previous_record = next(previous, None)
+
+            if previous_record is not None and previous_record[0] == key:
+                if previous_record[1] != digest:
+                    changes.updated.append(len(changes.rows))
+                    changes.rows.append(row)
+                previous_record = next(previous, None)
+            else:
+                changes.inserted.append(len(changes.rows))
+                changes.rows.append(row)
+
+            snapshot_writer.write(key, digest)
+
+        while previous_record is not None:
+            changes.deleted.append(previous_record[0])
+            previous_record = next(previous, None)
+
+        return changes
\ No newline at end of file
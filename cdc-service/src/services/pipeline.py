@@ -0,0 +1,230 @@
+import queue
+import threading
+import time
+from models import Changes
+from services.metrics import metrics
+
+# Put on a queue after the last batch
+DONE = object()
+
+class Aborted(Exception):
+    """Raised in a stage when another stage of the same run has failed."""
+
+class KeyMerge:
+    """Merge-joins key-ordered batches against previous (key, digest) records."""
+
+    def __init__(self, codec, previous_records):
+        self.codec = codec
+        self._previous = iter(previous_records)
+        self._record = next(self._previous, None)
+
+    def _advance(self):
+        self._record = next(self._previous, None)
+
+    def batch(self, rows, keys, digests):
+        """Changes of one batch; stored keys below its keys that were skipped are deletes."""
+        changes = Changes(rows, self.codec)
+        for index, (key, digest) in enumerate(zip(keys, digests)):
+            while self._record is not None and self._record[0] < key:
+                changes.deleted.append(self._record[0])
+                self._advance()
+            if self._record is not None and self._record[0] == key:
+                if self._record[1] != digest:
+                    changes.updated.append(index)
+                self._advance()
+            else:
+                changes.inserted.append(index)
+        return changes
+
+    def rest(self, rows):
+        """Deletes of the stored keys above the last batch."""
+        changes = Changes(rows, self.codec)
+        while self._record is not None:
+            changes.deleted.append(self._record[0])
+            self._advance()
+        return changes
+
+class PipelineRun:
+    """One table sync through a SyncPipeline."""
+
+    def __init__(self, pipeline, table, previous_records, output):
+        self.pipeline = pipeline
+        self.table = table
+        # Resolved up front, so the stage threads never query table metadata
+        self.codec = pipeline.mysql_reader.get_key_codec(table)
+        self.schema = pipeline.mysql_reader.get_schema(table)
+        self.previous_records = previous_records
+        self.output = output
+        self.fetched = queue.Queue(pipeline.queue_depth)
+        self.diffed = queue.Queue(pipeline.queue_depth)
+        self.failed = threading.Event()
+        self.errors = []
+        self.stalls = {'read_blocked': 0.0, 'diff_starved': 0.0, 'diff_blocked': 0.0, 'apply_starved': 0.0}
+        self.counts = {'inserted': 0, 'updated': 0, 'deleted': 0}
+        self.scan_seconds = 0.0
+
+    def _put(self, target, item, stall, gauge):
+        started = time.perf_counter()
+        while True:
+            if self.failed.is_set():
+                raise Aborted()
+            try:
+                target.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.stalls[stall] += time.perf_counter() - started
+        metrics.set_gauge(gauge, target.qsize(), self.table)
+
+    def _get(self, source, stall, gauge):
+        started = time.perf_counter()
+        while True:
+            if self.failed.is_set():
+                raise Aborted()
+            try:
+                item = source.get(timeout=0.1)
+                break
+            except queue.Empty:
+                pass
+        self.stalls[stall] += time.perf_counter() - started
+        metrics.set_gauge(gauge, source.qsize(), self.table)
+        return item
+
+    def _stage(self, target):
+        try:
+            # Stage threads run outside the table's cycle, so they are labelled explicitly
+            with metrics.table_label(self.table):
+                target()
+        except Aborted:
+            pass
+        except Exception as e:
+            self.errors.append(e)
+            self.failed.set()
+
+    def read(self):
+        """Read stage: key-ordered RowSets from MySQL."""
+        batches = self.pipeline.mysql_reader.iter_table_batches(self.table, self.pipeline.batch_size)
+        try:
+            for rows in batches:
+                self._put(self.fetched, rows, 'read_blocked', 'cdc_pipeline_fetched_depth')
+        finally:
+            # Ends the query, and releases the snapshot connection, if the run is aborted
+            batches.close()
+        self._put(self.fetched, DONE, 'read_blocked', 'cdc_pipeline_fetched_depth')
+
+    def diff(self):
+        """Diff stage: hash each batch, merge it with the previous records and gather its changes.
+
+        Changes are handed on once batch_size of them have gathered, so
+        sparse changes still go to Postgres in few transactions.
+        """
+        reader = self.pipeline.mysql_reader
+        codec, schema = self.codec, self.schema
+        merge = KeyMerge(codec, self.previous_records)
+        started = time.monotonic()
+        pending, pending_digests = Changes(schema.rowset(), codec), []
+
+        while True:
+            rows = self._get(self.fetched, 'diff_starved', 'cdc_pipeline_fetched_depth')
+            if rows is DONE:
+                break
+            digests = reader.hash_rows(rows)
+            keys = codec.pack_rows(rows)
+            changes = merge.batch(rows, keys, digests)
+            for key, digest in zip(keys, digests):
+                self.output.write(key, digest)
+            pending.extend(changes)
+            pending_digests.extend(digests[index] for index in changes.inserted)
+            pending_digests.extend(digests[index] for index in changes.updated)
+            if len(pending) >= self.pipeline.batch_size:
+                self._put(self.diffed, (pending, reader.combine_digests(pending_digests)),
+                          'diff_blocked', 'cdc_pipeline_diffed_depth')
+                pending, pending_digests = Changes(schema.rowset(), codec), []
+
+        pending.extend(merge.rest(schema.rowset()))
+        self.scan_seconds = time.monotonic() - started
+        if len(pending):
+            self._put(self.diffed, (pending, reader.combine_digests(pending_digests)),
+                      'diff_blocked', 'cdc_pipeline_diffed_depth')
+        self._put(self.diffed, DONE, 'diff_blocked', 'cdc_pipeline_diffed_depth')
+
+    def apply(self):
+        """Apply stage: each batch of changes goes to Postgres in its own transaction."""
+        while True:
+            item = self._get(self.diffed, 'apply_starved', 'cdc_pipeline_diffed_depth')
+            if item is DONE:
+                return
+            changes, checksum = item
+            with metrics.span('apply', self.table):
+                self.pipeline.postgres_writer.apply_changes(self.table, changes, checksum, record_status=False)
+            for sink in self.pipeline.sinks:
+                sink.publish(self.table, changes)
+            self.counts['inserted'] += len(changes.inserted)
+            self.counts['updated'] += len(changes.updated)
+            self.counts['deleted'] += len(changes.deleted)
+
+class SyncPipeline:
+    """Syncs a table as read, diff and apply stages running concurrently.
+
+    The read stage streams key-ordered batches from MySQL, the diff stage
+    hashes them and merge-joins them against the previous (key, digest)
+    records, and the apply stage writes the changes to Postgres. Stages are
+    joined by queues of at most queue_depth batches, so a slow stage holds
+    back the ones feeding it instead of letting batches pile up in memory.
+
+    Time a stage spends waiting on its neighbours is recorded as a stall
+    stage (read_blocked, diff_starved, diff_blocked, apply_starved), and
+    queue depths as gauges: a blocked reader means Postgres is the
+    bottleneck, a starved applier means MySQL or hashing is.
+
+    Every applied batch is also published to sinks.
+    """
+
+    def __init__(self, mysql_reader, postgres_writer, batch_size=1000, queue_depth=4, sinks=()):
+        self.mysql_reader = mysql_reader
+        self.postgres_writer = postgres_writer
+        self.batch_size = batch_size
+        self.queue_depth = queue_depth
+        self.sinks = list(sinks)
+
+    def run(self, table, previous_records, output, dependencies=()):
+        """Sync a table against previous_records, sorted (key, digest) pairs.
+
+        Every current (key, digest) pair is written to output in key order.
+        dependencies are futures waited on before the read stage starts:
+        it keeps its MySQL cursor open until the apply stage has taken the
+        last batch, and in a consistent snapshot that cursor holds the one
+        connection every table reads through, so a dependency waited on
+        later could never finish its own read.
+
+        Returns the counts of applied changes and the seconds spent reading
+        and diffing. If any stage fails the others stop and its error is
+        raised; batches applied before that stay applied.
+        """
+        with metrics.span('wait_dependencies', table):
+            for dependency in dependencies:
+                dependency.result()
+
+        run = PipelineRun(self, table, previous_records, output)
+        threads = [
+            threading.Thread(target=run._stage, args=(stage,), name=f"cdc-{stage.__name__}-{table}", daemon=True)
+            for stage in (run.read, run.diff)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            run.apply()
+        except Aborted:
+            pass
+        except Exception as e:
+            run.errors.append(e)
+            run.failed.set()
+        finally:
+            for thread in threads:
+                thread.join()
+
+        for stall, seconds in run.stalls.items():
+            metrics.observe(stall, seconds, table)
+        if run.errors:
+            raise run.errors[0]
+        return {**run.counts, 'scan_seconds': run.scan_seconds}
@@ -0,0 +1,105 @@
+import random
+import threading
+import time
+
+class PollScheduler:
+    """Decide when each table is polled next.
+
+    A table's interval follows its recent change rate: busy tables are
+    polled often enough to pick up about target_changes rows per poll, idle
+    ones drift towards max_interval. An interval is never shorter than
+    cost_ratio times the table's last scan, so slow scans cannot hog MySQL.
+    Failed polls back off exponentially with jitter.
+    """
+
+    def __init__(self, tables, initial_interval, min_interval, max_interval,
+                 target_changes=50, cost_ratio=5, smoothing=0.5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_changes = target_changes
+        self.cost_ratio = cost_ratio
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+        now = time.monotonic()
+        self._tables = {
+            table: {
+                'interval': self._clamp(initial_interval),
+                'next_poll': now,
+                'last_poll': now,
+                'change_rate': 0.0,
+                'scan_seconds': 0.0,
+                'errors': 0
+            }
+            for table in tables
+        }
+
+    def _clamp(self, interval):
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def due_tables(self):
+        """Tables whose next poll time has passed."""
+        now = time.monotonic()
+        with self._lock:
+            return [table for table, state in self._tables.items() if state['next_poll'] <= now]
+
+    def seconds_until_next(self):
+        """Seconds until the earliest scheduled poll."""
+        with self._lock:
+            next_poll = min(state['next_poll'] for state in self._tables.values())
+        return max(0.0, next_poll - time.monotonic())
+
+    def record_success(self, table, changes_count, scan_seconds):
+        """Reschedule a table after a successful poll."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._tables[table]
+            elapsed = max(now - state['last_poll'], 1e-3)
+            rate = changes_count / elapsed
+            state['change_rate'] = self.smoothing * rate + (1 - self.smoothing) * state['change_rate']
+
+            if state['change_rate'] > 0:
+                interval = self.target_changes / state['change_rate']
+            else:
+                interval = self.max_interval
+            interval = max(interval, scan_seconds * self.cost_ratio)
+
+            state['interval'] = self._clamp(interval)
+            state['scan_seconds'] = scan_seconds
+            state['last_poll'] = now
+            state['next_poll'] = now + state['interval']
+            state['errors'] = 0
+
+    def record_error(self, table):
+        """Back off a table after a failed poll."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._tables[table]
+            state['errors'] += 1
+            backoff = self._clamp(self.min_interval * 2 ** min(state['errors'], 16))
+            state['interval'] = random.uniform(backoff / 2, backoff)
+            state['next_poll'] = now + state['interval']
+
+    def backing_off(self, table):
+        """Whether a table's last poll failed."""
+        with self._lock:
+            return self._tables[table]['errors'] > 0
+
+    def postpone(self, table, until_table):
+        """Move a table's next poll back to the next poll of until_table."""
+        with self._lock:
+            state = self._tables[table]
+            state['next_poll'] = max(state['next_poll'], self._tables[until_table]['next_poll'])
+
+    def bring_forward(self, table):
+        """Poll a table as soon as its scan cost allows, unless it is backing off."""
+        with self._lock:
+            state = self._tables[table]
+            if state['errors'] == 0:
+                earliest = state['last_poll'] + self._clamp(state['scan_seconds'] * self.cost_ratio)
+                state['next_poll'] = min(state['next_poll'], earliest)
+
+    def intervals(self):
+        """Current poll interval of each table in seconds."""
+        with self._lock:
+            return {table: round(state['interval'], 2) for table, state in self._tables.items()}
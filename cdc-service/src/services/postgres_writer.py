@@ -1,82 +1,318 @@
 from sqlalchemy import create_engine, text
 from datetime import datetime
+import io
+import time
+from services.history import ChangeHistory
 
 class PostgresWriter:
-    def __init__(self, connection_string):
+    def __init__(self, connection_string, batch_size=1000, primary_keys=None, keep_history=False,
+                 history_retention_days=30):
         self.engine = create_engine(connection_string)
+        self.batch_size = batch_size
+        self.primary_keys = dict(primary_keys or {})
+        self.history = ChangeHistory(self.engine, history_retention_days) if keep_history else None
+        self._types = {}
+
+    def get_primary_key(self, table_name):
+        """Key columns of cdc.<table>, from primary_keys or information_schema."""
+        if table_name not in self.primary_keys:
+            with self.engine.connect() as connection:
+                rows = connection.execute(text("""
+                SELECT kcu.column_name
+                FROM information_schema.table_constraints tc
+                JOIN information_schema.key_column_usage kcu
+                    ON kcu.constraint_schema = tc.constraint_schema AND kcu.constraint_name = tc.constraint_name
+                WHERE tc.table_schema = 'cdc' AND tc.table_name = :table_name AND tc.constraint_type = 'PRIMARY KEY'
+                ORDER BY kcu.ordinal_position
+                """), {'table_name': table_name})
+                key_columns = [row[0] for row in rows]
+            if not key_columns:
+                raise ValueError(f"cdc.{table_name} has no primary key to use as the conflict target")
+            self.primary_keys[table_name] = key_columns
+        return self.primary_keys[table_name]
+
+    def apply_changes(self, table_name, changes, checksum, watermark=None, record_status=True, row_count=None):
+        """Apply detected changes to PostgreSQL in batches of batch_size rows.
+
+        Inserted and updated rows are read straight from the columns of
+        changes.rows by position. watermark, when given, is stored in cdc.sync_status in the same
+        transaction as the changes it covers, and so is row_count, the rows
+        of the table after the changes. Without record_status the caller
+        records the sync with record_sync() once all of it has landed.
+
+        With keep_history, the versions the changes replace or delete are
+        appended to cdc.<table>_history in the same transaction.
+        """
+        cdc_timestamp = datetime.now()
+        self.prepare_history(table_name, cdc_timestamp)
 
-    def apply_changes(self, table_name, changes, checksum):
-        """Apply detected changes to PostgreSQL."""
         with self.engine.begin() as connection:  # This creates a transaction
             try:
-                # Handle inserts
-                for row in changes['inserted']:
-                    self._insert_row(connection, table_name, row, 'I', checksum)
+                staging_table = None
 
-                # Handle updates
-                for row in changes['updated']:
-                    self._update_row(connection, table_name, row, 'U', checksum)
+                # Handle inserts and updates
+                for operation, indices in (('I', changes.inserted), ('U', changes.updated)):
+                    for start in range(0, len(indices), self.batch_size):
+                        if staging_table is None:
+                            staging_table = self._create_staging_table(connection, table_name)
+                        batch = indices[start:start + self.batch_size]
+                        started = time.monotonic()
+                        self._upsert_batch(connection, table_name, staging_table, changes.rows, batch,
+                                           operation, cdc_timestamp, checksum)
+                        self._report_batch(table_name, operation, len(batch), started)
 
                 # Handle deletes
-                for row in changes['deleted']:
-                    self._mark_deleted(connection, table_name, row, 'D', checksum)
+                keys = changes.deleted
+                for start in range(0, len(keys), self.batch_size):
+                    batch = [changes.codec.unpack(key) for key in keys[start:start + self.batch_size]]
+                    started = time.monotonic()
+                    self._delete_rows(connection, table_name, batch, cdc_timestamp)
+                    self._report_batch(table_name, 'D', len(batch), started)
 
                 # Update sync status
-                self._update_sync_status(connection, table_name, len(changes['inserted']) + 
-                                      len(changes['updated']) + len(changes['deleted']), checksum)
+                if record_status:
+                    self._update_sync_status(connection, table_name, row_count, checksum, watermark)
                 
             except Exception as e:
                 print(f"Error applying changes to {table_name}: {str(e)}")
                 raise
 
-    def _insert_row(self, connection, table_name, row, operation, checksum):
-        """Insert a row into the CDC schema."""
-        # Prepare the values
-        values = {**row, 
-                 'cdc_operation': operation,
-                 'cdc_timestamp': datetime.now(),
-                 'cdc_checksum': checksum}
-        
-        # Build the SQL dynamically based on the columns
-        columns = ', '.join(values.keys())
-        placeholders = ', '.join(f':{key}' for key in values.keys())
-        
+    def _report_batch(self, table_name, operation, row_count, started):
+        """Print the throughput of an applied batch."""
+        elapsed = max(time.monotonic() - started, 1e-6)
+        print(f"{datetime.now()} - Applied {row_count} '{operation}' rows to cdc.{table_name} "
+              f"in {elapsed:.3f}s ({row_count / elapsed:.0f} rows/s)")
+
+    def _create_staging_table(self, connection, table_name):
+        """Create a temporary staging table shaped like cdc.<table>, dropped at commit."""
+        staging_table = f"cdc_stage_{table_name}"
+        connection.execute(text(
+            f"CREATE TEMP TABLE {staging_table} (LIKE cdc.{table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+        ))
+        return staging_table
+
+    def copy_rows(self, connection, target, rows, indices, operation, cdc_timestamp, checksum):
+        """COPY the rows at indices of a RowSet, with their CDC columns, into target."""
+        columns = rows.columns + ['cdc_operation', 'cdc_timestamp', 'cdc_checksum']
+
+        buffer = io.StringIO()
+        for index in indices:
+            values = [column[index] for column in rows.values] + [operation, cdc_timestamp, checksum]
+            buffer.write('\t'.join(self._copy_value(v) for v in values))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {target} ({', '.join(columns)}) FROM STDIN", buffer)
+        finally:
+            cursor.close()
+        return columns
+
+    def _upsert_batch(self, connection, table_name, staging_table, rows, indices, operation, cdc_timestamp, checksum):
+        """COPY the rows at indices into the staging table and merge them with one upsert.
+
+        Rows whose values are unchanged keep their CDC columns, so a batch
+        applied twice does not move their cdc_timestamp.
+        """
+        connection.execute(text(f"TRUNCATE {staging_table}"))
+        columns = self.copy_rows(connection, staging_table, rows, indices, operation, cdc_timestamp, checksum)
+        column_list = ', '.join(columns)
+        key_columns = self.get_primary_key(table_name)
+        if self.history is not None:
+            self.history.record_replaced(connection, table_name, staging_table, key_columns)
+
         sql = f"""
-        INSERT INTO cdc.{table_name} ({columns})
-        VALUES ({placeholders})
-        ON CONFLICT (id) DO UPDATE 
+        INSERT INTO cdc.{table_name} AS target ({column_list})
+        SELECT {column_list} FROM {staging_table}
+        ON CONFLICT ({', '.join(key_columns)}) DO UPDATE 
         SET 
-            {', '.join(f"{k} = EXCLUDED.{k}" for k in values.keys())}
+            {', '.join(f"{k} = EXCLUDED.{k}" for k in columns)}
+        WHERE ({', '.join(f"target.{k}" for k in rows.columns)}) IS DISTINCT FROM
+              ({', '.join(f"EXCLUDED.{k}" for k in rows.columns)})
         """
         
-        connection.execute(text(sql), values)
+        connection.execute(text(sql))
+
+    def _copy_value(self, value):
+        """Encode a value for COPY's text format."""
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, datetime):
+            return value.isoformat(' ')
+        return (str(value)
+                .replace('\\', '\\\\')
+                .replace('\t', '\\t')
+                .replace('\n', '\\n')
+                .replace('\r', '\\r'))
+
+    def _delete_rows(self, connection, table_name, rows, cdc_timestamp):
+        """Delete a batch of rows from the CDC schema, moving them to the history if one is kept.
+
+        Only the primary key of each row is needed; the history gets the
+        last replicated values. Keys are passed as one array per key column
+        and joined through unnest.
+        """
+        key_columns = self.get_primary_key(table_name)
+        key_params = [f"key_{i}" for i in range(len(key_columns))]
+        sql = f"""
+        DELETE FROM cdc.{table_name} AS target
+        USING unnest({', '.join(f':{p}' for p in key_params)}) AS deleted({', '.join(key_params)})
+        WHERE {' AND '.join(f"target.{c} = deleted.{p}" for c, p in zip(key_columns, key_params))}
+        """
+        connection.execute(text(self._with_history(table_name, sql)), {
+            **{p: [row[c] for row in rows] for c, p in zip(key_columns, key_params)},
+            'cdc_timestamp': cdc_timestamp
+        })
+
+    def delete_key_range(self, connection, table_name, column, lower, upper, cdc_timestamp):
+        """Delete the rows of cdc.<table> whose column is in [lower, upper), moving them to the history if one is kept.
 
-    def _update_row(self, connection, table_name, row, operation, checksum):
-        """Update an existing row in the CDC schema."""
-        self._insert_row(connection, table_name, row, operation, checksum)
+        prepare_history() must have run for cdc_timestamp.
+        """
+        sql = f"DELETE FROM cdc.{table_name} AS target WHERE target.{column} >= :lower AND target.{column} < :upper"
+        connection.execute(text(self._with_history(table_name, sql)),
+                           {'lower': lower, 'upper': upper, 'cdc_timestamp': cdc_timestamp})
+
+    def _with_history(self, table_name, sql):
+        """A DELETE from cdc.<table> AS target that also appends the deleted rows to the history, if one is kept."""
+        if self.history is None:
+            return sql
+        return f"WITH removed AS ({sql} RETURNING target.*) {self.history.record_deleted_sql(table_name, 'removed')}"
+
+    def prepare_history(self, table_name, cdc_timestamp):
+        """Make sure the history of a table, if one is kept, can take changes made at cdc_timestamp."""
+        if self.history is not None:
+            self.history.prepare(table_name, self.get_primary_key(table_name), cdc_timestamp)
+
+    def prepare_tables(self, table_names):
+        """Delete the rows that earlier versions of the service only marked deleted in cdc.<table>.
+
+        Live tables hold only current rows, so readers need no cdc_operation filter.
+        """
+        with self.engine.begin() as connection:
+            for table_name in table_names:
+                removed = connection.execute(text(f"DELETE FROM cdc.{table_name} WHERE cdc_operation = 'D'")).rowcount
+                if removed:
+                    print(f"{datetime.now()} - Removed {removed} rows marked deleted from cdc.{table_name}")
 
-    def _mark_deleted(self, connection, table_name, row, operation, checksum):
-        """Mark a row as deleted in the CDC schema."""
-        self._insert_row(connection, table_name, row, operation, checksum)
+    def get_watermark(self, table_name):
+        """Get the stored high-water mark of a table, or None if there is none."""
+        with self.engine.connect() as connection:
+            return connection.execute(text(
+                "SELECT watermark FROM cdc.sync_status WHERE table_name = :table_name"
+            ), {'table_name': table_name}).scalar()
 
-    def _update_sync_status(self, connection, table_name, changes_count, checksum):
-        """Update the sync status table."""
+    def mark_synced(self, table_name, row_count=None):
+        """Record a successful sync that found no changes, so readers can tell the mirror is current."""
+        with self.engine.begin() as connection:
+            connection.execute(text("""
+            INSERT INTO cdc.sync_status (table_name, last_sync_time, last_success_sync_time, row_count, status)
+            VALUES (:table_name, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, :row_count, 'SUCCESS')
+            ON CONFLICT (table_name)
+            DO UPDATE SET
+                last_sync_time = CURRENT_TIMESTAMP,
+                last_success_sync_time = CURRENT_TIMESTAMP,
+                row_count = COALESCE(:row_count, cdc.sync_status.row_count),
+                status = 'SUCCESS'
+            """), {'table_name': table_name, 'row_count': row_count})
+
+    def mark_backfilled(self, table_name, row_count, checksum, watermark=None):
+        """Record a finished backfill of a table in cdc.sync_status."""
+        self.record_sync(table_name, row_count, checksum, watermark)
+
+    def record_sync(self, table_name, row_count, checksum, watermark=None):
+        """Record a successful sync whose changes were applied in separate transactions."""
+        with self.engine.begin() as connection:
+            self._update_sync_status(connection, table_name, row_count, checksum, watermark)
+
+    def _update_sync_status(self, connection, table_name, row_count, checksum, watermark=None):
+        """Update the sync status table; row_count is the rows of the table, kept when None."""
         sql = """
         INSERT INTO cdc.sync_status 
-            (table_name, last_sync_time, last_success_sync_time, row_count, last_checksum, status)
+            (table_name, last_sync_time, last_success_sync_time, row_count, last_checksum, status, watermark)
         VALUES 
-            (:table_name, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, :changes_count, :checksum, 'SUCCESS')
+            (:table_name, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, :row_count, :checksum, 'SUCCESS', :watermark)
         ON CONFLICT (table_name) 
         DO UPDATE SET 
             last_sync_time = CURRENT_TIMESTAMP,
             last_success_sync_time = CURRENT_TIMESTAMP,
-            row_count = :changes_count,
+            row_count = COALESCE(:row_count, cdc.sync_status.row_count),
             last_checksum = :checksum,
-            status = 'SUCCESS'
+            status = 'SUCCESS',
+            watermark = COALESCE(:watermark, cdc.sync_status.watermark)
         """
         
         connection.execute(text(sql), {
             'table_name': table_name,
-            'changes_count': changes_count,
-            'checksum': checksum
-        })
\ No newline at end of file
+            'row_count': row_count,
+            'checksum': checksum,
+            'watermark': watermark
+        })
+
+    def _column_types(self, table_name):
+        """Data type of each column of cdc.<table>, from information_schema."""
+        if table_name not in self._types:
+            with self.engine.connect() as connection:
+                rows = connection.execute(text("""
+                SELECT column_name, data_type FROM information_schema.columns
+                WHERE table_schema = 'cdc' AND table_name = :table_name
+                """), {'table_name': table_name})
+                self._types[table_name] = {row[0]: row[1] for row in rows}
+        return self._types[table_name]
+
+    def _row_hash_sql(self, table_name, columns):
+        """SQL for the MD5 of a mirrored row's source columns as text, matching MySQLReader._row_hash_sql.
+
+        Booleans are cast to integers, which is how MySQL stores and prints them.
+        """
+        types = self._column_types(table_name)
+        values = [f"{c}::int" if types.get(c) == 'boolean' else c for c in columns]
+        return "md5(concat_ws('#', {}, concat({})))".format(
+            ', '.join(values),
+            ', '.join(f"({c} IS NULL)::int" for c in columns)
+        )
+
+    def get_key_range(self, table_name):
+        """Lowest and highest value of the leading key column of the mirrored rows."""
+        column = self.get_primary_key(table_name)[0]
+        with self.engine.connect() as connection:
+            row = connection.execute(text(
+                f"SELECT MIN({column}), MAX({column}) FROM cdc.{table_name}"
+            )).fetchone()
+        return row[0], row[1]
+
+    def checksum_key_range(self, table_name, columns, lower, upper):
+        """(row_count, hash_hi, hash_lo) of the mirrored rows whose leading key column is in [lower, upper).
+
+        columns are the source columns, hashed like MySQLReader.checksum_key_range does.
+        """
+        column = self.get_primary_key(table_name)[0]
+        sql = f"""
+        SELECT
+            COUNT(*),
+            COALESCE(SUM(('x' || substr(row_hash, 1, 15))::bit(60)::bigint), 0),
+            COALESCE(SUM(('x' || substr(row_hash, 16, 15))::bit(60)::bigint), 0)
+        FROM (
+            SELECT {self._row_hash_sql(table_name, columns)} AS row_hash
+            FROM cdc.{table_name}
+            WHERE {column} >= :lower AND {column} < :upper
+        ) AS hashed
+        """
+        with self.engine.connect() as connection:
+            row = connection.execute(text(sql), {'lower': lower, 'upper': upper}).fetchone()
+        return int(row[0]), int(row[1]), int(row[2])
+
+    def get_row_hashes(self, table_name, columns, lower, upper):
+        """Map the key tuple of each mirrored row whose leading key column is in [lower, upper) to its row MD5."""
+        key_columns = self.get_primary_key(table_name)
+        sql = f"""
+        SELECT {', '.join(key_columns)}, {self._row_hash_sql(table_name, columns)}
+        FROM cdc.{table_name}
+        WHERE {key_columns[0]} >= :lower AND {key_columns[0]} < :upper
+        """
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(sql), {'lower': lower, 'upper': upper}).fetchall()
+        return {tuple(row[:-1]): row[-1] for row in rows}
@@ -0,0 +1,70 @@
+from collections import Counter
+import os
+import signal
+import sys
+import threading
+import time
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler that writes folded stacks for flame graphs.
+
+    While running, a background thread records the stack of every other
+    thread each interval seconds. stop() writes the samples in the folded
+    "frame;frame;frame count" format read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, output_dir, interval=0.005):
+        self.output_dir = output_dir
+        self.interval = interval
+        self._samples = Counter()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._samples.clear()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample, name='cdc-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and write the profile; returns the file path."""
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"cdc-profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, 'w') as f:
+            for stack, count in self._samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def toggle(self, *args):
+        if self.running:
+            print(f"Profiler stopped, flame graph samples written to {self.stop()}")
+        else:
+            self.start()
+            print("Profiler started")
+
+    def install(self, signum=signal.SIGUSR1):
+        """Toggle profiling whenever the process receives signum."""
+        signal.signal(signum, self.toggle)
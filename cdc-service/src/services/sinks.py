@@ -0,0 +1,185 @@
+import collections
+import json
+import os
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from services.metrics import metrics
+
+class ChangeSink(ABC):
+    """Base of the consumers that get every batch of changes applied to Postgres.
+
+    publish() copies the changed rows of a batch out as events and only
+    queues them, so a slow or failing sink never holds up the Postgres
+    path and never keeps the batch's RowSet, which for a full sync is the
+    whole table, alive. A thread per sink passes the events to
+    write_events() once flush_events have gathered or the oldest has
+    waited flush_seconds; a failed write is retried with backoff. At most
+    max_pending events wait: a batch that would exceed that is dropped and
+    counted in cdc_sink_events_dropped_total.
+
+    Delivery is at least once, since a batch applied again after a failed
+    sync is published again. Rows copied by the initial backfill are not
+    published: sinks see a backfilled table's changes from its first
+    cycle on, so a consumer needing the existing rows starts from a copy
+    of cdc.<table> taken after the backfill.
+    """
+
+    name = 'sink'
+
+    def __init__(self, flush_events=1000, flush_seconds=1.0, max_pending=100000):
+        self.flush_events = flush_events
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._batches = collections.deque()
+        self._pending = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    @abstractmethod
+    def write_events(self, events):
+        """Deliver a list of event dicts; raise to have them retried."""
+
+    def publish(self, table_name, changes):
+        """Queue the changes of one applied batch as events without waiting for the sink."""
+        if not len(changes):
+            return
+        events = self._events(table_name, changes, datetime.now())
+        with self._condition:
+            if self._pending + len(events) > self.max_pending:
+                metrics.inc('cdc_sink_events_dropped_total', len(events), table_name)
+                print(f"{datetime.now()} - Sink {self.name} is {self._pending} events behind, "
+                      f"dropped {len(events)} changes of {table_name}")
+                return
+            self._batches.append((time.monotonic(), table_name, events))
+            self._pending += len(events)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"cdc-sink-{self.name}", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def close(self, timeout=10):
+        """Flush what is queued and stop the sink thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _take(self):
+        """Wait until a flush is due and take the queued batches, or return None once closed and empty."""
+        with self._condition:
+            while not self._batches and not self._closed:
+                self._condition.wait()
+            if not self._batches:
+                return None
+            deadline = self._batches[0][0] + self.flush_seconds
+            while self._pending < self.flush_events and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batches = list(self._batches)
+            self._batches.clear()
+            self._pending = 0
+            return batches
+
+    def _events(self, table_name, changes, cdc_timestamp):
+        """One event per changed row: the table, operation, time, key and row (None for deletes)."""
+        key_columns = changes.codec.columns
+        events = []
+        for operation, indices in (('I', changes.inserted), ('U', changes.updated)):
+            for index in indices:
+                row = changes.rows.row(index)
+                events.append({'table': table_name, 'op': operation, 'ts': cdc_timestamp,
+                               'key': {c: row[c] for c in key_columns}, 'row': row})
+        for key in changes.deleted_keys():
+            events.append({'table': table_name, 'op': 'D', 'ts': cdc_timestamp, 'key': key, 'row': None})
+        return events
+
+    def _run(self):
+        while True:
+            batches = self._take()
+            if batches is None:
+                return
+            events = [event for _, _, batch_events in batches for event in batch_events]
+            delay = 1
+            while True:
+                try:
+                    with metrics.span(f'sink_{self.name}', ''):
+                        self.write_events(events)
+                    break
+                except Exception as e:
+                    print(f"{datetime.now()} - Sink {self.name} failed to write {len(events)} events: {str(e)}")
+                    if self._closed:
+                        return
+                    time.sleep(delay)
+                    delay = min(delay * 2, 30)
+            for _, table_name, batch_events in batches:
+                metrics.inc('cdc_sink_events_total', len(batch_events), table_name)
+
+class JsonlSink(ChangeSink):
+    """Appends change events as JSON lines to <directory>/changes.jsonl.
+
+    Once the file reaches max_bytes it is renamed to
+    changes-<timestamp>.jsonl and a new one started, so consumers can
+    process rotated files in name order and then tail the current one.
+    """
+
+    name = 'jsonl'
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, **policy):
+        super().__init__(**policy)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'changes.jsonl')
+        self._file = open(self.path, 'a')
+
+    def write_events(self, events):
+        self._file.write(''.join(json.dumps(event, default=str) + '\n' for event in events))
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        os.rename(self.path, os.path.join(self.directory, f"changes-{datetime.now():%Y%m%d%H%M%S%f}.jsonl"))
+        self._file = open(self.path, 'a')
+
+    def close(self, timeout=10):
+        super().close(timeout)
+        self._file.close()
+
+class SocketSink(ChangeSink):
+    """Sends change events as JSON lines over TCP, a local stand-in for a message broker.
+
+    The connection is opened on the first write and again after a failure.
+    """
+
+    name = 'socket'
+
+    def __init__(self, host, port, timeout=5, **policy):
+        super().__init__(**policy)
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._socket = None
+
+    def write_events(self, events):
+        if self._socket is None:
+            self._socket = socket.create_connection((self.host, self.port), self.timeout)
+        try:
+            self._socket.sendall(''.join(json.dumps(event, default=str) + '\n' for event in events).encode())
+        except OSError:
+            self._socket.close()
+            self._socket = None
+            raise
+
+    def close(self, timeout=10):
+        super().close(timeout)
+        if self._socket is not None:
+            self._socket.close()
@@ -0,0 +1,98 @@
+import hashlib
+import mmap
+import os
+import struct
+
+# Files start with a magic string and the packed key width of the table
+HEADER = struct.Struct('>8sH')
+MAGIC = b'CDCSNAP2'
+
+def record_struct(key_size):
+    """One record per row: the packed primary key followed by a 16-byte digest."""
+    return struct.Struct(f'>{key_size}s16s')
+
+class SnapshotWriter:
+    def __init__(self, path, key_size):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.count = 0
+        self._record = record_struct(key_size)
+        self._hash = hashlib.sha256()
+        self._file = open(self.tmp_path, 'wb', buffering=1024 * 1024)
+        self._file.write(HEADER.pack(MAGIC, key_size))
+
+    def write(self, key, digest):
+        """Append a record; keys must be written in ascending order."""
+        record = self._record.pack(key, digest)
+        self._file.write(record)
+        self._hash.update(record)
+        self.count += 1
+
+    def checksum(self):
+        """Checksum over every record written so far."""
+        return self._hash.hexdigest()
+
+    def commit(self):
+        """Atomically replace the previous snapshot with the one just written."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        # Make the rename itself durable
+        directory = os.open(os.path.dirname(self.path) or '.', os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def discard(self):
+        """Drop the snapshot being written and keep the previous one."""
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+class SnapshotStore:
+    """Sorted on-disk files of (packed primary key, digest) records, one per table."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, table_name):
+        return os.path.join(self.directory, f"{table_name}.snap")
+
+    def exists(self, table_name, key_size):
+        """Whether a table has a snapshot written with keys of key_size bytes.
+
+        Files of an older format or another key layout count as missing.
+        """
+        try:
+            with open(self.path(table_name), 'rb') as f:
+                header = f.read(HEADER.size)
+        except FileNotFoundError:
+            return False
+        return len(header) == HEADER.size and HEADER.unpack(header) == (MAGIC, key_size)
+
+    def read(self, table_name, key_size):
+        """Yield the stored (key, digest) records of a table in key order.
+
+        The file is memory-mapped, so records are paged in by the OS rather
+        than read into Python buffers.
+        """
+        if not self.exists(table_name, key_size):
+            return
+        with open(self.path(table_name), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == HEADER.size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                records = memoryview(mapped)[HEADER.size:]
+                iterator = record_struct(key_size).iter_unpack(records)
+                try:
+                    yield from iterator
+                finally:
+                    # The map cannot close while views of it are alive
+                    del iterator
+                    records.release()
+
+    def writer(self, table_name, key_size):
+        return SnapshotWriter(self.path(table_name), key_size)
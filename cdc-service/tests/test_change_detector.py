@@ -0,0 +1,136 @@
+from services import change_detector
+from services.change_detector import ChangeDetector
+from services.poll_scheduler import PollScheduler
+
+TABLES = {'student': {}, 'course': {}, 'registration': {}}
+
+class FailingDetector(ChangeDetector):
+    """ChangeDetector whose syncs of the failing tables raise and whose other syncs find nothing."""
+
+    def __init__(self, failing, changes=None, **kwargs):
+        super().__init__(None, None, TABLES, table_dependencies={'registration': ['student', 'course']},
+                         scheduler=PollScheduler(TABLES, initial_interval=1, min_interval=1, max_interval=60),
+                         **kwargs)
+        self.failing = failing
+        self.changes = changes or {}
+        self.attempts = {table: 0 for table in TABLES}
+
+    def _sync_table_changes(self, table, dependencies=()):
+        self.attempts[table] += 1
+        for dependency in dependencies:
+            dependency.result()
+        if table in self.failing:
+            raise RuntimeError(f"{table} is unreadable")
+        return self.changes.get(table, 0), 0.0
+
+def run_cycles(detector, monkeypatch, cycles=50):
+    monkeypatch.setattr(change_detector.time, 'sleep', lambda seconds: None)
+    for _ in range(cycles):
+        detector._run_scheduled()
+
+def test_failing_dependency_backs_off_sequentially(monkeypatch):
+    detector = FailingDetector({'student'})
+    run_cycles(detector, monkeypatch)
+
+    assert detector.attempts == {'student': 1, 'course': 1, 'registration': 0}
+    assert detector.scheduler.due_tables() == []
+    assert detector.scheduler.seconds_until_next() > 0
+
+def test_failing_dependency_backs_off_in_parallel(monkeypatch):
+    detector = FailingDetector({'student'}, max_workers=3)
+    run_cycles(detector, monkeypatch)
+
+    assert detector.attempts['student'] == 1
+    assert detector.attempts['course'] == 1
+    assert detector.scheduler.due_tables() == []
+
+def test_dependents_of_a_backed_off_table_are_postponed(monkeypatch):
+    detector = FailingDetector({'student'})
+    run_cycles(detector, monkeypatch, cycles=1)
+    # registration comes due again while student is still backing off
+    detector.scheduler._tables['registration']['next_poll'] = 0
+    run_cycles(detector, monkeypatch, cycles=1)
+
+    assert detector.attempts == {'student': 1, 'course': 1, 'registration': 0}
+    assert detector.scheduler._tables['registration']['next_poll'] >= detector.scheduler._tables['student']['next_poll']
+
+def test_due_table_does_not_scan_dependencies_that_are_not_due(monkeypatch):
+    detector = FailingDetector(set(), changes={'registration': 5})
+    run_cycles(detector, monkeypatch, cycles=1)
+    for table in TABLES:
+        detector.scheduler._tables[table]['next_poll'] += 1000
+    detector.scheduler._tables['registration']['next_poll'] = 0
+    run_cycles(detector, monkeypatch, cycles=1)
+
+    assert detector.attempts == {'student': 1, 'course': 1, 'registration': 2}
+    # registration changed, so its dependencies are polled as soon as their scan cost allows
+    student = detector.scheduler._tables['student']
+    assert student['next_poll'] <= student['last_poll'] + detector.scheduler.min_interval
+
+class WatermarkWriter:
+    """Postgres writer stand-in recording the inserted ids; can be made to fail once."""
+
+    def __init__(self):
+        self.inserted = []
+        self.fail_next = False
+
+    def prepare_tables(self, tables):
+        pass
+
+    def get_watermark(self, table_name):
+        return None
+
+    def apply_changes(self, table_name, changes, checksum, watermark=None, record_status=True, row_count=None):
+        if self.fail_next:
+            self.fail_next = False
+            raise RuntimeError("Postgres is down")
+        self.inserted.extend(changes.rows.row(index)['id'] for index in changes.inserted)
+
+    def mark_synced(self, table_name, row_count=None):
+        pass
+
+def test_watermark_polls_append_without_rewriting_state(tmp_path):
+    from sqlalchemy import create_engine, text
+    from services.mysql_reader import MySQLReader
+    from services.snapshot_store import SnapshotStore
+
+    url = f"sqlite:///{tmp_path / 'source.db'}"
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE registration (id INTEGER PRIMARY KEY, note TEXT)")
+        connection.execute(text("INSERT INTO registration VALUES (:id, 'seed')"), [{'id': i} for i in range(1, 101)])
+    def insert(*ids):
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO registration VALUES (:id, 'new')"), [{'id': i} for i in ids])
+
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    writer = WatermarkWriter()
+    detector = ChangeDetector(MySQLReader(url), writer, {'registration': {'strategy': 'watermark', 'reconcile_every': 3}},
+                              snapshot_store=store)
+    detector.initialize()
+    modified = (tmp_path / 'snapshots' / 'registration.snap').stat().st_mtime_ns
+    base_index = detector.previous_states['registration']['index']
+
+    insert(101, 102)
+    detector.detect_and_sync()
+    insert(103)
+    writer.fail_next = True
+    try:
+        detector.detect_and_sync()
+    except RuntimeError:
+        pass
+    insert(104)
+    detector.detect_and_sync()
+
+    state = detector.previous_states['registration']
+    assert state['index'] is base_index
+    assert state['appended_count'] == 4
+    assert writer.inserted == [101, 102, 103, 104]
+    assert (tmp_path / 'snapshots' / 'registration.snap').stat().st_mtime_ns == modified
+
+    # The third successful cycle reconciles, which joins the index and checkpoints it
+    detector.detect_and_sync()
+    state = detector.previous_states['registration']
+    assert state['appended_count'] == 0 and len(state['index']) == 104
+    assert writer.inserted == [101, 102, 103, 104]
+    assert len(list(store.read('registration', detector._key_size('registration')))) == 104
@@ -0,0 +1,46 @@
+from datetime import date, datetime
+from sqlalchemy import create_engine, event, text
+from services.history import ChangeHistory
+
+class CatalogHistory(ChangeHistory):
+    """ChangeHistory with the Postgres catalog lookups answered from fixed values, so as_of runs on SQLite."""
+
+    def columns(self, table_name):
+        return ['id', 'course_id']
+
+    def _partition_days(self, connection, table_name):
+        return [date(2024, 1, 1)]
+
+def test_as_of_reads_replaced_and_deleted_rows_from_history(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'mirror.db'}")
+    event.listen(engine, 'connect', lambda connection, record: connection.execute(
+        f"ATTACH DATABASE '{tmp_path / 'cdc.db'}' AS cdc"
+    ))
+    before, at, after = datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 12), datetime(2024, 1, 1, 15)
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE cdc.registration (id INTEGER PRIMARY KEY, course_id INTEGER, cdc_timestamp TIMESTAMP)"
+        )
+        connection.exec_driver_sql(
+            "CREATE TABLE cdc.registration_history (id INTEGER, course_id INTEGER, cdc_operation TEXT, "
+            "cdc_timestamp TIMESTAMP, cdc_valid_from TIMESTAMP)"
+        )
+        # After at: 1 moved to course 20, 2 was deleted and 4 inserted; 3 is unchanged
+        connection.execute(text("INSERT INTO cdc.registration VALUES (:id, :course_id, :cdc_timestamp)"), [
+            {'id': 1, 'course_id': 20, 'cdc_timestamp': after},
+            {'id': 3, 'course_id': 30, 'cdc_timestamp': before},
+            {'id': 4, 'course_id': 40, 'cdc_timestamp': after}
+        ])
+        connection.execute(text(
+            "INSERT INTO cdc.registration_history VALUES (:id, :course_id, :operation, :cdc_timestamp, :valid_from)"
+        ), [
+            {'id': 1, 'course_id': 10, 'operation': 'U', 'cdc_timestamp': after, 'valid_from': before},
+            {'id': 2, 'course_id': 11, 'operation': 'D', 'cdc_timestamp': after, 'valid_from': before}
+        ])
+
+    history = CatalogHistory(engine)
+    rows = sorted(history.as_of('registration', at), key=lambda row: row['id'])
+
+    assert rows == [{'id': 1, 'course_id': 10}, {'id': 2, 'course_id': 11}, {'id': 3, 'course_id': 30}]
+    assert history.as_of('registration', at, key={'id': 1}) == [{'id': 1, 'course_id': 10}]
+    assert history.as_of('registration', at, key={'id': 4}) == []
@@ -0,0 +1,10 @@
+from services.mysql_reader import MySQLReader
+
+def test_row_digests_keep_values_apart(tmp_path):
+    reader = MySQLReader(f"sqlite:///{tmp_path / 'source.db'}")
+    digest = lambda *values: reader._hash_columns([[value] for value in values])[0]
+
+    assert digest('a\x1fb', 'c') != digest('a', 'b\x1fc')
+    assert digest('ab', 'c') != digest('a', 'bc')
+    assert len({digest(None), digest('\0'), digest('None'), digest('-'), digest('')}) == 5
+    assert digest(1, None) == digest(1, None) != digest(None, 1)
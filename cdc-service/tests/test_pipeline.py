@@ -0,0 +1,97 @@
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, text
+from services.change_detector import ChangeDetector
+from services.mysql_reader import MySQLReader
+from services.pipeline import SyncPipeline
+
+class RecordingWriter:
+    """Postgres writer stand-in that records the order batches are applied in."""
+
+    def __init__(self):
+        self.applied = []
+
+    def apply_changes(self, table_name, changes, checksum, watermark=None, record_status=True, row_count=None):
+        self.applied.append((table_name, len(changes)))
+
+    def record_sync(self, table_name, row_count, checksum, watermark=None):
+        pass
+
+    def mark_synced(self, table_name, row_count=None):
+        pass
+
+class SnapshotReader(MySQLReader):
+    """MySQLReader whose consistent snapshot is one shared SQLite connection.
+
+    Reads of student start late, so registration's read holds the
+    snapshot first, as a slower dependency would let it in MySQL.
+    """
+
+    @contextmanager
+    def consistent_snapshot(self):
+        with self.engine.connect() as connection:
+            self._snapshot_connection = connection.execution_options(stream_results=True)
+            try:
+                yield
+            finally:
+                self._snapshot_connection = None
+
+    def iter_table_batches(self, table_name, batch_size=1000):
+        if table_name == 'student':
+            time.sleep(0.2)
+        yield from super().iter_table_batches(table_name, batch_size)
+
+def seed(path):
+    url = f"sqlite:///{path}"
+    with create_engine(url).begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE student (student_id INTEGER PRIMARY KEY, name TEXT)")
+        connection.exec_driver_sql(
+            "CREATE TABLE registration (registration_id INTEGER PRIMARY KEY, student_id INTEGER)"
+        )
+        connection.execute(text("INSERT INTO student VALUES (:id, :name)"),
+                           [{'id': i, 'name': f"student {i}"} for i in range(10)])
+        connection.execute(text("INSERT INTO registration VALUES (:id, :student_id)"),
+                           [{'id': i, 'student_id': i % 10} for i in range(50)])
+    return url
+
+def test_dependent_table_in_snapshot_does_not_deadlock(tmp_path):
+    reader = SnapshotReader(seed(tmp_path / 'source.db'))
+    reader.engine = create_engine(reader.engine.url, connect_args={'check_same_thread': False})
+    writer = RecordingWriter()
+    detector = ChangeDetector(
+        reader, writer, {'student': {'strategy': 'full'}, 'registration': {'strategy': 'full'}},
+        max_workers=2, table_dependencies={'registration': ['student']}, consistent_snapshot=True,
+        pipeline=SyncPipeline(reader, writer, batch_size=2, queue_depth=1)
+    )
+
+    errors = []
+    def sync():
+        try:
+            detector.detect_and_sync()
+        except Exception as e:
+            errors.append(e)
+    thread = threading.Thread(target=sync, daemon=True)
+    thread.start()
+    thread.join(10)
+
+    assert not thread.is_alive(), "sync deadlocked"
+    assert not errors
+    tables = [table for table, _ in writer.applied]
+    assert sum(count for table, count in writer.applied if table == 'student') == 10
+    assert sum(count for table, count in writer.applied if table == 'registration') == 50
+    assert tables.index('registration') > len(tables) - 1 - tables[::-1].index('student')
+
+def test_stage_metrics_are_labelled_with_the_table(tmp_path):
+    from services.metrics import metrics
+
+    reader = MySQLReader(seed(tmp_path / 'source.db'))
+    writer = RecordingWriter()
+    detector = ChangeDetector(reader, writer, {'registration': {'strategy': 'full'}},
+                              pipeline=SyncPipeline(reader, writer, batch_size=10, queue_depth=1))
+    hashed_before = metrics._durations.get(('hash', 'registration'), {}).get('count', 0)
+    unlabelled_before = metrics._durations.get(('hash', ''), {}).get('count', 0)
+    detector.detect_and_sync()
+
+    assert metrics._durations[('hash', 'registration')]['count'] == hashed_before + 5
+    assert metrics._durations.get(('hash', ''), {}).get('count', 0) == unlabelled_before
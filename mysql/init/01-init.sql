@@ -30,6 +30,16 @@ CREATE TABLE registration (
     course_id INT NOT NULL,
     registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (student_id) REFERENCES student(id),
+    FOREIGN KEY (course_id) REFERENCES course(id),
+    UNIQUE KEY _student_course_uc (student_id, course_id)
+) ENGINE=InnoDB;
+
+-- Seat counters for capacity-aware enrollment (webapp/src/enrollment.py);
+-- courses without a row have no seat limit
+CREATE TABLE course_seat (
+    course_id INT PRIMARY KEY,
+    capacity INT NOT NULL,
+    taken INT NOT NULL DEFAULT 0,
     FOREIGN KEY (course_id) REFERENCES course(id)
 ) ENGINE=InnoDB;
 
@@ -44,4 +54,6 @@ INSERT INTO course (code, name) VALUES
     ('CS201', 'Data Structures'),
     ('CS301', 'Algorithms'),
     ('CS401', 'Database Systems'),
-    ('CS501', 'Machine Learning');
\ No newline at end of file
+    ('CS501', 'Machine Learning');
+
+INSERT INTO course_seat (course_id, capacity) SELECT id, 100 FROM course;
\ No newline at end of file
@@ -19,7 +19,7 @@ CREATE TABLE IF NOT EXISTS cdc.student (
     name VARCHAR(100) NOT NULL,
     student_id VARCHAR(20) UNIQUE NOT NULL,
     -- CDC-specific columns
-    cdc_operation CHAR(1) NOT NULL, -- I: Insert, U: Update, D: Delete
+    cdc_operation CHAR(1) NOT NULL, -- I: Insert, U: Update
     cdc_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     cdc_checksum TEXT NOT NULL -- To detect changes
 );
@@ -45,6 +45,10 @@ CREATE TABLE IF NOT EXISTS cdc.registration (
     cdc_checksum TEXT NOT NULL
 );
 
+-- Deleted rows leave these tables. With HISTORY=true the CDC service keeps the
+-- versions that changes replace or delete in cdc.<table>_history, partitioned
+-- by day (cdc-service/src/services/history.py)
+
 -- Create a table to track CDC status
 CREATE TABLE IF NOT EXISTS cdc.sync_status (
     table_name VARCHAR(100) PRIMARY KEY,
@@ -52,5 +56,17 @@ CREATE TABLE IF NOT EXISTS cdc.sync_status (
     last_success_sync_time TIMESTAMP,
     row_count INT,
     last_checksum TEXT,
-    status VARCHAR(50)
+    status VARCHAR(50),
+    watermark BIGINT -- Highest key replicated by watermark capture
+);
+
+-- Per-range progress of the initial backfill (cdc-service/src/services/backfill.py)
+CREATE TABLE IF NOT EXISTS cdc.backfill_progress (
+    table_name VARCHAR(100) NOT NULL,
+    chunk_no BIGINT NOT NULL, -- Range [chunk_no * chunk size, (chunk_no + 1) * chunk size) of the leading key column
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    row_count BIGINT,
+    started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+    PRIMARY KEY (table_name, chunk_no)
 );
\ No newline at end of file
@@ -0,0 +1,155 @@
+"""Enrollment-window load test for the sync (app.py) and async (async_app.py) webapps.
+
+Every virtual student signs up, opens the registration page, registers for
+two courses and views their enrollments, like the burst at the start of an
+enrollment window. Latency percentiles are reported per route and target:
+
+    python bench/load_test.py --target sync=http://localhost:5000 --target async=http://localhost:5001 \\
+        --students 500 --concurrency 100 --output load_test.json
+
+Both targets must point at the same kind of database for a fair comparison.
+Only the standard library is used.
+"""
+import argparse
+import http.client
+import json
+import random
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+CSRF_PATTERN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+COURSE_PATTERN = re.compile(r'<option value="(\d+)"')
+
+class Client:
+    """Cookie-keeping HTTP client that records the latency of every request."""
+
+    def __init__(self, base_url, timings):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timings = timings
+        self.cookies = {}
+
+    def request(self, route, method, path, form=None):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        headers = {}
+        body = None
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in self.cookies.items())
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            text = response.read().decode()
+        finally:
+            connection.close()
+        self.timings.append((route, time.perf_counter() - started, response.status))
+
+        for header in response.msg.get_all('Set-Cookie') or []:
+            name, _, value = header.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value
+        return response.status, text
+
+def csrf_token(html):
+    match = CSRF_PATTERN.search(html)
+    return match.group(1) if match else ''
+
+def student_session(base_url, run_id, number, timings):
+    """One student's signup, registration and enrollment view."""
+    client = Client(base_url, timings)
+    student_id = f"{run_id}-{number}"
+
+    _, html = client.request('GET /signup', 'GET', '/signup')
+    client.request('POST /signup', 'POST', '/signup', [
+        ('csrf_token', csrf_token(html)),
+        ('username', f"load-{student_id}"),
+        ('password', 'load-test'),
+        ('confirm_password', 'load-test'),
+        ('name', f"Load Student {number}"),
+        ('student_id', student_id)
+    ])
+
+    _, html = client.request('GET /register', 'GET', '/register')
+    course_ids = COURSE_PATTERN.findall(html)
+    form = [('csrf_token', csrf_token(html)), ('name', f"Load Student {number}"), ('student_id', student_id)]
+    form += [('courses', course_id) for course_id in random.sample(course_ids, min(2, len(course_ids)))]
+    client.request('POST /register', 'POST', '/register', form)
+
+    client.request('GET /enrollments', 'GET', f"/enrollments?student_id={student_id}")
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(timings, elapsed):
+    if not timings:
+        return {'all': {'requests': 0, 'errors': 0, 'p50_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0,
+                        'requests_per_second': 0.0}}
+    routes = {}
+    for route, seconds, status in timings:
+        routes.setdefault(route, []).append((seconds, status))
+    routes['all'] = [(seconds, status) for _, seconds, status in timings]
+
+    summary = {}
+    for route, samples in routes.items():
+        latencies = [seconds for seconds, _ in samples]
+        summary[route] = {
+            'requests': len(samples),
+            'errors': sum(1 for _, status in samples if status >= 500),
+            'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_ms': max(latencies) * 1000
+        }
+    summary['all']['requests_per_second'] = len(timings) / elapsed
+    return summary
+
+def run_target(base_url, students, concurrency):
+    run_id = uuid.uuid4().hex[:8]
+    timings = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(student_session, base_url, run_id, n, timings) for n in range(students)]
+        failures = 0
+        for future in futures:
+            try:
+                future.result()
+            except OSError:
+                failures += 1
+    summary = summarize(timings, time.perf_counter() - started)
+    summary['all']['failed_sessions'] = failures
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, help='NAME=BASE_URL, may be repeated')
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results = {}
+    for target in args.target:
+        name, _, base_url = target.partition('=')
+        results[name] = run_target(base_url, args.students, args.concurrency)
+
+    print(f"{'target':<8} {'route':<18} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, summary in results.items():
+        for route, stats in summary.items():
+            print(f"{name:<8} {route:<18} {stats['requests']:>8} {stats['errors']:>6} "
+                  f"{stats['p50_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f}")
+        print(f"{name:<8} {summary['all']['requests_per_second']:.1f} requests/s, "
+              f"{summary['all']['failed_sessions']} failed sessions")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
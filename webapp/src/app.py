@@ -1,12 +1,20 @@
-from flask import Flask, render_template, request, flash, redirect, url_for, session
+from flask import Flask, render_template, request, flash, redirect, url_for, session, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from markupsafe import Markup
+from sqlalchemy.orm import joinedload
 from flask_wtf import FlaskForm
 from wtforms import StringField, SelectMultipleField, SubmitField, PasswordField, BooleanField
 from wtforms.validators import DataRequired, Length, ValidationError
-from werkzeug.security import generate_password_hash, check_password_hash
 import os
+import secrets
+import time
 from datetime import datetime
 from functools import wraps
+from course_cache import CourseCatalogCache
+from password_hasher import PasswordHasher, HashingBusy
+from enrollment import EnrollmentEngine, EnrollmentBusy, SEAT_COUNTER_BACKFILL
+from page_cache import StudentPageCache, Uncached
+from read_replica import ReadRouter
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key'  # Don't use this in production
@@ -15,6 +23,45 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
 
+# Set COURSE_CACHE_VERSION_FILE to a path shared by all workers to share invalidations
+course_cache = CourseCatalogCache(
+    ttl=int(os.getenv('COURSE_CACHE_TTL', 300)),
+    version_file=os.getenv('COURSE_CACHE_VERSION_FILE')
+)
+
+# Rendered enrollment fragments per student; STUDENT_PAGE_CACHE_DIR shares invalidations between workers
+student_page_cache = StudentPageCache(
+    ttl=int(os.getenv('STUDENT_PAGE_CACHE_TTL', 300)),
+    version_dir=os.getenv('STUDENT_PAGE_CACHE_DIR')
+)
+
+# Read-only page queries go to the Postgres CDC mirror while its lag is within READ_REPLICA_MAX_LAG
+read_router = ReadRouter(
+    replica_url=os.getenv('REPLICA_DATABASE_URL'),
+    max_lag=float(os.getenv('READ_REPLICA_MAX_LAG', 30)),
+    check_interval=float(os.getenv('READ_REPLICA_CHECK_INTERVAL', 1))
+)
+# After a write, a session reads from MySQL for this long so it sees its own changes
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', 60))
+
+# Password hashing runs on a small process pool with bounded queueing, so a
+# login spike cannot starve the request threads serving other pages
+password_hasher = PasswordHasher(
+    max_workers=int(os.getenv('HASH_WORKERS', 2)),
+    max_pending=int(os.getenv('HASH_MAX_PENDING', 32)),
+    queue_timeout=float(os.getenv('HASH_QUEUE_TIMEOUT', 2)),
+    cache_ttl=int(os.getenv('AUTH_CACHE_TTL', 300))
+)
+
+# Enrollments and drops are queued and applied in batches against the
+# course_seat counters, so hot courses cannot be overbooked
+enrollment_engine = EnrollmentEngine(
+    db.engine,
+    batch_size=int(os.getenv('ENROLLMENT_BATCH_SIZE', 200)),
+    batch_window=float(os.getenv('ENROLLMENT_BATCH_WINDOW', 0.005)),
+    timeout=float(os.getenv('ENROLLMENT_TIMEOUT', 10))
+)
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
@@ -23,10 +70,10 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+    def check_password(self, password, session_key=None):
+        return password_hasher.verify(self.password_hash, password, session_key)
 
 class Student(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -49,6 +96,11 @@ class Registration(db.Model):
     # Add unique constraint to prevent duplicate registrations
     __table_args__ = (db.UniqueConstraint('student_id', 'course_id', name='_student_course_uc'),)
 
+class CourseSeat(db.Model):
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), primary_key=True)
+    capacity = db.Column(db.Integer, nullable=False)
+    taken = db.Column(db.Integer, nullable=False, default=0)
+
 class RegistrationForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired()])
     student_id = StringField('Student ID', validators=[DataRequired()])
@@ -74,6 +126,79 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Random per-session value that keys the password verification cache
+def auth_session_key():
+    if 'auth_key' not in session:
+        session['auth_key'] = secrets.token_hex(16)
+    return session['auth_key']
+
+# Course catalog as (id, code, name) tuples, served from the course cache
+def get_courses():
+    return course_cache.get(lambda: read_router.read(
+        read_router.courses,
+        lambda: [(c.id, c.code, c.name) for c in Course.query.order_by(Course.id).all()]
+    ))
+
+# Load a student with their registrations and courses in one joined query
+def get_student_with_enrollments(student_id):
+    return (Student.query
+            .options(joinedload(Student.registrations).joinedload(Registration.course))
+            .filter_by(student_id=student_id)
+            .first())
+
+# Remember that this session wrote, so its next reads see the change
+def note_write():
+    session['last_write_at'] = time.time()
+
+def recently_wrote():
+    return time.time() - session.get('last_write_at', 0) < READ_YOUR_WRITES_SECONDS
+
+# A student's name and enrollments as plain dicts, from the CDC mirror when fresh; None if there is no such student
+def load_student_enrollments(student_id):
+    def from_primary():
+        student = get_student_with_enrollments(student_id)
+        if not student:
+            return None
+        return {
+            'name': student.name,
+            'student_id': student.student_id,
+            'enrollments': [{
+                'id': reg.id,
+                'course_id': reg.course_id,
+                'course_code': reg.course.code,
+                'course_name': reg.course.name,
+                'registration_date': reg.registration_date
+            } for reg in student.registrations]
+        }
+    return read_router.read(lambda: read_router.student_enrollments(student_id), from_primary, pinned=recently_wrote())
+
+# Student dashboard card; None if there is no such student
+def render_enrollments_card(student_id):
+    student = load_student_enrollments(student_id)
+    if not student:
+        return None
+    card = Markup(render_template('_enrollments_card.html', student=student, enrollments=student['enrollments']))
+    # Pages read from the mirror may lack the student's latest write, so they are not cached
+    return Uncached(card) if student.get('mirrored') else card
+
+# Name and current-enrollments card shown on the register page; None if there is no such student
+def render_registrations_card(student_id):
+    student = load_student_enrollments(student_id)
+    if not student:
+        return None
+    card = render_template('_registrations_card.html', registrations=student['enrollments'], student_id=student_id)
+    details = {'name': student['name'], 'card': Markup(card)}
+    return Uncached(details) if student.get('mirrored') else details
+
+# Flash the outcome of an enrollment request, naming any full courses
+def flash_enrollment_result(result):
+    if result.full:
+        codes = {course_id: code for course_id, code, _ in get_courses()}
+        full = ', '.join(codes.get(course_id, str(course_id)) for course_id in result.full)
+        flash(f'These courses are full: {full}', 'warning')
+    if result.enrolled or not result.full:
+        flash('Course registration successful!', 'success')
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if 'user_id' in session:
@@ -82,7 +207,12 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            valid = user is not None and user.check_password(form.password.data, auth_session_key())
+        except HashingBusy:
+            flash('Too many sign-ins right now, please try again in a moment', 'error')
+            return render_template('login.html', form=form), 503
+        if valid:
             session['user_id'] = user.id
             session['is_admin'] = user.is_admin
             next_page = request.args.get('next')
@@ -103,13 +233,13 @@ def index():
 @login_required
 def register():
     form = RegistrationForm()
-    form.courses.choices = [(c.id, f"{c.code} - {c.name}") for c in Course.query.all()]
+    form.courses.choices = [(course_id, f"{code} - {name}") for course_id, code, name in get_courses()]
     
-    # Initialize registrations as None
-    registrations = None
+    # Initialize the enrollments card as None
+    registrations_card = None
     
-    # Get the current user's student record
-    student = Student.query.filter_by(student_id=session.get('student_id')).first()
+    # Get the current user's student record; GETs are served from the page cache
+    student = get_student_with_enrollments(session.get('student_id')) if request.method == 'POST' else None
     
     if form.validate_on_submit():
         try:
@@ -128,24 +258,21 @@ def register():
                 db.session.add(student)
                 session['student_id'] = form.student_id.data
             
-            # Ensure student is in the session
-            db.session.flush()
-            
-            # Get current registrations
-            existing_registrations = {r.course_id for r in student.registrations}
-            
-            # Process new registrations
-            for course_id in form.courses.data:
-                if course_id not in existing_registrations:
-                    registration = Registration(student_id=student.id, course_id=course_id)
-                    db.session.add(registration)
-            
+            # Save the student before the seats are claimed
             db.session.commit()
-            flash('Course registration successful!', 'success')
+            note_write()
+            
+            # Claim seats for all selected courses in one batched request
+            try:
+                flash_enrollment_result(enrollment_engine.enroll(student.id, form.courses.data))
+            finally:
+                student_page_cache.invalidate(student.student_id)
             
             # Redirect to student dashboard
             return redirect(url_for('view_enrollments', student_id=student.student_id))
             
+        except EnrollmentBusy:
+            flash('Too many registrations right now, please try again in a moment', 'error')
         except Exception as e:
             db.session.rollback()
             flash(f'Error during registration: {str(e)}', 'error')
@@ -155,16 +282,17 @@ def register():
         # If form validation failed
         flash('Please correct the errors in the form.', 'error')
     
-    # Show existing registrations if student ID is provided
-    if student:
-        form.student_id.data = student.student_id
-        form.name.data = student.name
-        registrations = [
-            {'course_code': reg.course.code, 'course_name': reg.course.name}
-            for reg in student.registrations
-        ]
+    # Show existing registrations if the user has a student record
+    student_id = session.get('student_id')
+    if student_id:
+        pages = student_page_cache.pages(student_id)
+        details = student_page_cache.fragment(pages, 'register', lambda: render_registrations_card(student_id))
+        if details:
+            form.student_id.data = student_id
+            form.name.data = details['name']
+            registrations_card = details['card']
     
-    return render_template('register.html', form=form, registrations=registrations)
+    return render_template('register.html', form=form, registrations_card=registrations_card)
 
 @app.route('/enrollments', methods=['GET'])
 @login_required
@@ -180,23 +308,18 @@ def view_enrollments():
         flash('You can only view your own enrollments', 'error')
         return redirect(url_for('register'))
     
-    student = Student.query.filter_by(student_id=student_id).first()
+    # Unchanged enrollments are answered with 304, unless there are messages to show
+    pages = student_page_cache.pages(student_id)
+    if not session.get('_flashes') and pages.not_modified(request):
+        return '', 304, pages.headers()
     
-    if not student:
+    card = student_page_cache.fragment(pages, 'enrollments', lambda: render_enrollments_card(student_id))
+    
+    if not card:
         flash(f'No student found with ID: {student_id}', 'error')
         return redirect(url_for('register'))
     
-    enrollments = []
-    for reg in student.registrations:
-        enrollments.append({
-            'id': reg.id,
-            'course_id': reg.course_id,
-            'course_code': reg.course.code,
-            'course_name': reg.course.name,
-            'registration_date': reg.registration_date
-        })
-    
-    return render_template('enrollments.html', student=student, enrollments=enrollments)
+    return render_template('enrollments.html', card=card), 200, pages.headers('enrollments')
 
 @app.route('/manage-enrollments', methods=['GET', 'POST'])
 @login_required
@@ -219,7 +342,7 @@ def manage_enrollments():
             flash('You can only manage your own enrollments', 'error')
             return redirect(url_for('register'))
             
-        student = Student.query.filter_by(student_id=form.student_id.data).first()
+        student = get_student_with_enrollments(form.student_id.data)
         if student:
             # Get current enrollments
             current_enrollments = student.registrations
@@ -229,24 +352,15 @@ def manage_enrollments():
     
     if request.method == 'POST' and form.validate_on_submit():
         try:
-            student = Student.query.filter_by(student_id=form.student_id.data).first()
-            
             if not student:
                 flash(f'No student found with ID: {form.student_id.data}', 'error')
                 return redirect(url_for('manage_enrollments'))
             
             # Process drops
             if form.courses_to_drop.data:
-                for course_id in form.courses_to_drop.data:
-                    registration = Registration.query.filter_by(
-                        student_id=student.id, 
-                        course_id=course_id
-                    ).first()
-                    
-                    if registration:
-                        db.session.delete(registration)
-                
-                db.session.commit()
+                enrollment_engine.drop(student.id, form.courses_to_drop.data)
+                note_write()
+                student_page_cache.invalidate(student.student_id)
                 flash('Selected courses have been dropped successfully', 'success')
                 return redirect(url_for('view_enrollments', student_id=student.student_id))
             else:
@@ -294,6 +408,39 @@ def create_sample_courses():
         for course in sample_courses:
             db.session.add(course)
         db.session.commit()
+        course_cache.invalidate()
+
+@app.before_first_request
+def create_seat_counters():
+    CourseSeat.__table__.create(db.engine, checkfirst=True)
+    db.session.execute(SEAT_COUNTER_BACKFILL, {'capacity': int(os.getenv('COURSE_CAPACITY', 100))})
+    db.session.commit()
+
+@app.route('/admin/course-cache', methods=['GET', 'POST'])
+@login_required
+def course_cache_status():
+    # Hit/miss counters for admins; POST drops the cached catalog
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+    if request.method == 'POST':
+        course_cache.invalidate()
+    return jsonify(course_cache.stats())
+
+@app.route('/admin/read-routing', methods=['GET'])
+@login_required
+def read_routing_status():
+    # Mirror lag and how many reads it served, for admins
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+    return jsonify(read_router.stats())
+
+@app.route('/admin/page-cache', methods=['GET'])
+@login_required
+def student_page_cache_status():
+    # Hit/miss counters of the per-student fragment cache, for admins
+    if not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+    return jsonify(student_page_cache.stats())
 
 class SignUpForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=4, max=50)])
@@ -339,9 +486,14 @@ def signup():
             # Log the user in
             session['user_id'] = user.id
             session['student_id'] = student.student_id
+            note_write()
             flash('Registration successful! Welcome!', 'success')
             return redirect(url_for('register'))
             
+        except HashingBusy:
+            db.session.rollback()
+            flash('Too many sign-ups right now, please try again in a moment', 'error')
+            return render_template('signup.html', form=form), 503
         except Exception as e:
             db.session.rollback()
             flash(f'Error during registration: {str(e)}', 'error')
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+import uuid
+
+class CourseCatalogCache:
+    """In-process cache of the course catalog with a TTL and explicit invalidation.
+
+    Every process keeps its own full copy of the catalog; only
+    invalidations are shared. When version_file is set, every worker
+    compares the file's token with the one its copy was loaded under and
+    reloads from the database when they differ, so all gunicorn workers
+    see a new catalog as soon as one of them invalidates.
+    """
+
+    def __init__(self, ttl=300, version_file=None):
+        self.ttl = ttl
+        self.version_file = version_file
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._courses = None
+        self._version = None
+        self._expires_at = 0
+
+    def _shared_version(self):
+        if not self.version_file:
+            return None
+        try:
+            with open(self.version_file) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _lookup(self, version):
+        with self._lock:
+            if self._courses is not None and time.monotonic() < self._expires_at and version == self._version:
+                self.hits += 1
+                return self._courses
+            self.misses += 1
+            return None
+
+    def _store(self, courses, version):
+        with self._lock:
+            self._courses = courses
+            self._version = version
+            self._expires_at = time.monotonic() + self.ttl
+        return courses
+
+    def get(self, loader):
+        """Return the cached catalog, calling loader() to refresh it when stale."""
+        version = self._shared_version()
+        courses = self._lookup(version)
+        if courses is None:
+            courses = self._store(loader(), version)
+        return courses
+
+    async def get_async(self, loader):
+        """Like get(), for a coroutine function loader."""
+        version = self._shared_version()
+        courses = self._lookup(version)
+        if courses is None:
+            courses = self._store(await loader(), version)
+        return courses
+
+    def invalidate(self):
+        """Drop the cached catalog here and, with a version file, in every worker."""
+        with self._lock:
+            self._courses = None
+        if self.version_file:
+            tmp_path = f"{self.version_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(uuid.uuid4().hex)
+            os.replace(tmp_path, self.version_file)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'cached': self._courses is not None,
+                'ttl': self.ttl
+            }
@@ -0,0 +1,199 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from sqlalchemy import bindparam, column, select, table, text
+from sqlalchemy.exc import IntegrityError
+
+# Gives every course without a counter :capacity seats, counting its existing registrations
+SEAT_COUNTER_BACKFILL = text(
+    "INSERT INTO course_seat (course_id, capacity, taken) "
+    "SELECT c.id, :capacity, (SELECT COUNT(*) FROM registration r WHERE r.course_id = c.id) "
+    "FROM course c LEFT JOIN course_seat s ON s.course_id = c.id WHERE s.course_id IS NULL"
+)
+
+course_seat = table('course_seat', column('course_id'), column('capacity'), column('taken'))
+
+class EnrollmentBusy(Exception):
+    """Raised when the enrollment queue is full."""
+
+class EnrollmentResult:
+    def __init__(self):
+        self.enrolled = []
+        self.already_enrolled = []
+        self.full = []
+        self.dropped = []
+
+class _Request:
+    def __init__(self, kind, student_id, course_ids):
+        self.kind = kind
+        self.student_id = student_id
+        self.course_ids = list(dict.fromkeys(course_ids))
+        self.future = Future()
+
+class EnrollmentEngine:
+    """Capacity-aware enrollment with contention-safe batched writes.
+
+    Seat counts live in the course_seat table (capacity, taken), one row per
+    course; courses without a row are unlimited. Enroll and drop requests
+    are queued and a single dispatcher thread per process applies them in
+    batches: each batch locks the seat rows of the courses it touches once,
+    in course order, hands out seats in arrival order and writes all its
+    registrations with one multi-row INSERT. Requests for a hot course are
+    thus coalesced into one row update per batch instead of each request
+    queueing on the same row lock, and the counters can never exceed
+    capacity because they only change under that lock.
+    """
+
+    def __init__(self, engine, batch_size=200, batch_window=0.005, max_queue=10000, timeout=10):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _ensure_dispatcher(self):
+        # Started on first use, after any worker fork
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._dispatch, name='enrollment', daemon=True)
+                self._thread.start()
+
+    def submit(self, kind, student_id, course_ids, block=True):
+        """Queue an 'enroll' or 'drop' request and return a Future of its EnrollmentResult."""
+        self._ensure_dispatcher()
+        request = _Request(kind, student_id, course_ids)
+        try:
+            self._queue.put(request, block=block, timeout=self.timeout)
+        except queue.Full:
+            raise EnrollmentBusy()
+        return request.future
+
+    def enroll(self, student_id, course_ids):
+        return self.submit('enroll', student_id, course_ids).result(self.timeout)
+
+    def drop(self, student_id, course_ids):
+        return self.submit('drop', student_id, course_ids).result(self.timeout)
+
+    async def enroll_async(self, student_id, course_ids):
+        future = self.submit('enroll', student_id, course_ids, block=False)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+
+    async def drop_async(self, student_id, course_ids):
+        future = self.submit('drop', student_id, course_ids, block=False)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        # Linger briefly so concurrent requests land in the same batch
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results = self._apply(batch)
+            except IntegrityError:
+                # A conflicting write from another process; apply one by one so it only fails its own request
+                for request in batch:
+                    try:
+                        self._resolve([request], self._apply([request]))
+                    except Exception as e:
+                        request.future.set_exception(e)
+                continue
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            self._resolve(batch, results)
+
+    def _resolve(self, batch, results):
+        for request, result in zip(batch, results):
+            request.future.set_result(result)
+
+    def _apply(self, batch):
+        """Apply a batch of requests in one transaction and return their results."""
+        course_ids = sorted({course_id for request in batch for course_id in request.course_ids})
+        student_ids = sorted({request.student_id for request in batch})
+        results = [EnrollmentResult() for _ in batch]
+        if not course_ids:
+            return results
+
+        with self.engine.begin() as connection:
+            # Lock the seat rows in a fixed order, so concurrent batches cannot deadlock
+            rows = connection.execute(
+                select(course_seat)
+                .where(course_seat.c.course_id.in_(course_ids))
+                .order_by(course_seat.c.course_id)
+                .with_for_update()
+            )
+            seats = {row.course_id: [row.capacity, row.taken] for row in rows}
+            original_taken = {course_id: seat[1] for course_id, seat in seats.items()}
+
+            rows = connection.execute(text(
+                "SELECT student_id, course_id FROM registration "
+                "WHERE student_id IN :student_ids AND course_id IN :course_ids"
+            ).bindparams(bindparam('student_ids', expanding=True), bindparam('course_ids', expanding=True)),
+                {'student_ids': student_ids, 'course_ids': course_ids})
+            existing = {(row.student_id, row.course_id) for row in rows}
+
+            # Drops first, so their seats can go to this batch's enrollments
+            for request, result in zip(batch, results):
+                if request.kind != 'drop':
+                    continue
+                result.dropped = [c for c in request.course_ids if (request.student_id, c) in existing]
+                if not result.dropped:
+                    continue
+                connection.execute(text(
+                    "DELETE FROM registration WHERE student_id = :student_id AND course_id IN :course_ids"
+                ).bindparams(bindparam('course_ids', expanding=True)),
+                    {'student_id': request.student_id, 'course_ids': result.dropped})
+                for course_id in result.dropped:
+                    existing.discard((request.student_id, course_id))
+                    if course_id in seats:
+                        seats[course_id][1] -= 1
+
+            registrations = []
+            registration_date = datetime.utcnow()
+            for request, result in zip(batch, results):
+                if request.kind != 'enroll':
+                    continue
+                for course_id in request.course_ids:
+                    if (request.student_id, course_id) in existing:
+                        result.already_enrolled.append(course_id)
+                        continue
+                    seat = seats.get(course_id)
+                    if seat is not None:
+                        if seat[1] >= seat[0]:
+                            result.full.append(course_id)
+                            continue
+                        seat[1] += 1
+                    existing.add((request.student_id, course_id))
+                    result.enrolled.append(course_id)
+                    registrations.append({
+                        'student_id': request.student_id,
+                        'course_id': course_id,
+                        'registration_date': registration_date
+                    })
+
+            if registrations:
+                connection.execute(text(
+                    "INSERT INTO registration (student_id, course_id, registration_date) "
+                    "VALUES (:student_id, :course_id, :registration_date)"
+                ), registrations)
+
+            changed = [{'course_id': c, 'taken': seat[1]} for c, seat in seats.items() if seat[1] != original_taken[c]]
+            if changed:
+                connection.execute(text("UPDATE course_seat SET taken = :taken WHERE course_id = :course_id"), changed)
+
+        return results
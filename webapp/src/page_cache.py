@@ -0,0 +1,155 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from werkzeug.http import http_date
+
+class Uncached:
+    """A rendered fragment for fragment() to return without caching it.
+
+    Fragments read from the CDC mirror are wrapped in it: the mirror may
+    not have the student's latest write yet, and a cached copy would be
+    served, and revalidated with a current ETag, long after the write's
+    read-your-writes window has ended.
+    """
+
+    def __init__(self, fragment):
+        self.fragment = fragment
+
+class StudentPages:
+    """One student's cached fragments and the HTTP validators they were rendered under."""
+
+    def __init__(self, version, ttl, previous=None):
+        last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        # HTTP dates have one-second resolution; keep them increasing per student
+        if previous is not None and last_modified <= previous.last_modified:
+            last_modified = previous.last_modified + timedelta(seconds=1)
+        self.version = version
+        self.expires_at = time.monotonic() + ttl
+        self.last_modified = last_modified
+        self.etag = uuid.uuid4().hex[:20]
+        self.fragments = {}
+
+    def headers(self, name=None):
+        """Response headers; without validators when the fragment name was served uncached."""
+        if name is not None and name not in self.fragments:
+            return {'Cache-Control': 'private, no-cache'}
+        # Pages are per student, so only the browser may keep them, and it must revalidate
+        return {
+            'ETag': f'"{self.etag}"',
+            'Last-Modified': http_date(self.last_modified),
+            'Cache-Control': 'private, no-cache'
+        }
+
+    def not_modified(self, request):
+        """Whether a conditional GET can be answered with 304 Not Modified."""
+        if request.if_none_match:
+            return request.if_none_match.contains(self.etag)
+        return request.if_modified_since is not None and request.if_modified_since >= self.last_modified
+
+class StudentPageCache:
+    """In-process cache of rendered page fragments per student.
+
+    A student's entry holds whatever fragments of their pages have been
+    rendered, plus an ETag and Last-Modified for conditional GETs. It is
+    dropped after ttl seconds or when invalidate() is called from a write
+    path that changes the student's registrations. With version_dir set,
+    invalidations are shared through one token file per student, the same
+    way the course catalog cache shares them through its version file.
+    """
+
+    def __init__(self, ttl=300, version_dir=None, max_students=10000):
+        self.ttl = ttl
+        self.version_dir = version_dir
+        self.max_students = max_students
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _version_file(self, student_id):
+        return os.path.join(self.version_dir, hashlib.sha1(student_id.encode()).hexdigest())
+
+    def _shared_version(self, student_id):
+        if not self.version_dir:
+            return None
+        try:
+            with open(self._version_file(student_id)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def pages(self, student_id):
+        """Return the student's current entry, starting a new one when stale."""
+        version = self._shared_version(student_id)
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is None or entry.version != version or entry.expires_at < time.monotonic():
+                entry = StudentPages(version, self.ttl, previous=entry)
+                self._entries[student_id] = entry
+            self._entries.move_to_end(student_id)
+            while len(self._entries) > self.max_students:
+                self._entries.popitem(last=False)
+            return entry
+
+    def _lookup(self, pages, name):
+        with self._lock:
+            if name in pages.fragments:
+                self.hits += 1
+                return pages.fragments[name]
+            self.misses += 1
+            return None
+
+    def _store(self, pages, name, fragment):
+        if isinstance(fragment, Uncached):
+            return fragment.fragment
+        # A missing student is not cached, so it shows up as soon as it is created
+        if fragment is not None:
+            with self._lock:
+                pages.fragments[name] = fragment
+        return fragment
+
+    def fragment(self, pages, name, render):
+        """Return a cached fragment of pages, calling render() on a miss.
+
+        render() may wrap its fragment in Uncached to keep it out of the cache.
+        """
+        fragment = self._lookup(pages, name)
+        if fragment is None:
+            fragment = self._store(pages, name, render())
+        return fragment
+
+    async def fragment_async(self, pages, name, render):
+        """Like fragment(), for a coroutine function render."""
+        fragment = self._lookup(pages, name)
+        if fragment is None:
+            fragment = self._store(pages, name, await render())
+        return fragment
+
+    def invalidate(self, student_id):
+        """Drop the student's fragments here and, with a version dir, in every worker."""
+        with self._lock:
+            # Kept as a stale entry, so the next one gets a later Last-Modified
+            entry = self._entries.get(student_id)
+            if entry is not None:
+                entry.expires_at = 0
+                entry.fragments = {}
+        if self.version_dir:
+            os.makedirs(self.version_dir, exist_ok=True)
+            path = self._version_file(student_id)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(uuid.uuid4().hex)
+            os.replace(tmp_path, path)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'students': len(self._entries),
+                'ttl': self.ttl
+            }
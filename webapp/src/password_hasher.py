@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class HashingBusy(Exception):
+    """Raised when too many hashes are already queued."""
+
+class PasswordHasher:
+    """Runs password hashing on a bounded process pool.
+
+    At most max_pending hashes are queued or running; further callers wait
+    up to queue_timeout seconds for a slot and then get HashingBusy, so a
+    login storm cannot pile up unbounded work. Successful verifications are
+    remembered for cache_ttl seconds per (session key, password hash,
+    password), so a repeated sign-in from the same session skips the hash.
+    """
+
+    def __init__(self, max_workers=2, max_pending=32, queue_timeout=2.0, cache_ttl=300, cache_size=10000):
+        self.max_workers = max_workers
+        self.queue_timeout = queue_timeout
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Cache keys are HMACs under a per-process key, so no password-derived value outlives the process
+        self._cache_secret = secrets.token_bytes(32)
+
+    def _pool(self):
+        # Created on first use, after any worker fork
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _submit(self, func, *args):
+        try:
+            future = self._pool().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy()
+        return self._submit(func, *args).result()
+
+    async def _run_async(self, func, *args):
+        deadline = time.monotonic() + self.queue_timeout
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise HashingBusy()
+            await asyncio.sleep(0.01)
+        return await asyncio.wrap_future(self._submit(func, *args))
+
+    def _cache_key(self, session_key, password_hash, password):
+        message = '\0'.join((session_key, password_hash, password)).encode()
+        return hmac.new(self._cache_secret, message, hashlib.sha256).digest()
+
+    def _cached(self, key):
+        with self._cache_lock:
+            expires_at = self._cache.get(key)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return False
+            return True
+
+    def _remember(self, key):
+        with self._cache_lock:
+            self._cache[key] = time.monotonic() + self.cache_ttl
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password)
+
+    async def hash_async(self, password):
+        return await self._run_async(generate_password_hash, password)
+
+    def verify(self, password_hash, password, session_key=None):
+        """Check a password; session_key enables the verification cache."""
+        key = self._cache_key(session_key, password_hash, password) if session_key else None
+        if key is not None and self._cached(key):
+            return True
+        valid = self._run(check_password_hash, password_hash, password)
+        if valid and key is not None:
+            self._remember(key)
+        return valid
+
+    async def verify_async(self, password_hash, password, session_key=None):
+        key = self._cache_key(session_key, password_hash, password) if session_key else None
+        if key is not None and self._cached(key):
+            return True
+        valid = await self._run_async(check_password_hash, password_hash, password)
+        if valid and key is not None:
+            self._remember(key)
+        return valid
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+from sqlalchemy import bindparam, create_engine, text
+
+class ReadRouter:
+    """Routes read-only queries to the Postgres CDC mirror while it is fresh.
+
+    The mirror counts as fresh when every table the webapp reads has a
+    cdc.sync_status.last_success_sync_time within max_lag seconds. The
+    check runs at most once per check_interval; while the mirror is stale,
+    unreachable or not configured, callers read from MySQL instead.
+    """
+
+    TABLES = ('student', 'course', 'registration')
+
+    def __init__(self, replica_url=None, max_lag=30, check_interval=1, pool_size=10):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.engine = create_engine(replica_url, pool_size=pool_size, pool_pre_ping=True) if replica_url else None
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self._lock = threading.Lock()
+        self._lag = None
+        self._checked_at = 0
+
+    def _measure_lag(self):
+        # Measured on the Postgres clock, the one last_success_sync_time was written with
+        with self.engine.connect() as connection:
+            row = connection.execute(text(
+                "SELECT COUNT(*) AS tables, "
+                "MAX(EXTRACT(EPOCH FROM (LOCALTIMESTAMP - last_success_sync_time))) AS lag "
+                "FROM cdc.sync_status WHERE table_name IN :tables AND last_success_sync_time IS NOT NULL"
+            ).bindparams(bindparam('tables', expanding=True)), {'tables': list(self.TABLES)}).one()
+        if row.tables < len(self.TABLES):
+            return None
+        return float(row.lag)
+
+    def lag(self):
+        """Seconds since the least recently synced table, or None if unknown."""
+        if self.engine is None:
+            return None
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return self._lag
+            self._checked_at = time.monotonic()
+        try:
+            lag = self._measure_lag()
+        except Exception as e:
+            print(f"Read replica unavailable: {str(e)}")
+            lag = None
+        with self._lock:
+            self._lag = lag
+        return lag
+
+    def available(self):
+        """Whether reads may go to the mirror right now."""
+        lag = self.lag()
+        return lag is not None and lag <= self.max_lag
+
+    def _replica_read(self, replica_read, pinned):
+        # None means the read has to go to MySQL
+        if pinned or not self.available():
+            return None
+        try:
+            result = replica_read()
+        except Exception as e:
+            print(f"Read replica query failed, using MySQL: {str(e)}")
+            return None
+        if result is not None:
+            with self._lock:
+                self.replica_reads += 1
+        return result
+
+    def read(self, replica_read, primary_read, pinned=False):
+        """Return replica_read() from the mirror when allowed, else primary_read().
+
+        pinned forces MySQL, e.g. for a session that has just written. A
+        replica_read() returning None (a row not mirrored yet) also falls
+        back to MySQL.
+        """
+        result = self._replica_read(replica_read, pinned)
+        if result is None:
+            with self._lock:
+                self.primary_reads += 1
+            result = primary_read()
+        return result
+
+    async def read_async(self, replica_read, primary_read, pinned=False):
+        """Like read(), running the mirror query on a thread and awaiting the coroutine function primary_read."""
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, self._replica_read, replica_read, pinned)
+        if result is None:
+            with self._lock:
+                self.primary_reads += 1
+            result = await primary_read()
+        return result
+
+    def courses(self):
+        """The course catalog as (id, code, name) tuples."""
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(
+                "SELECT id, code, name FROM cdc.course ORDER BY id"
+            ))
+            return [(row.id, row.code, row.name) for row in rows]
+
+    def student_enrollments(self, student_id):
+        """A student's name and enrollments in the shape the pages render, or None if not mirrored.
+
+        The result is marked 'mirrored', so pages rendered from it are not cached.
+        """
+        with self.engine.connect() as connection:
+            rows = connection.execute(text(
+                "SELECT s.name, s.student_id, r.id AS registration_id, r.course_id, r.registration_date, "
+                "c.code AS course_code, c.name AS course_name "
+                "FROM cdc.student s "
+                "LEFT JOIN cdc.registration r ON r.student_id = s.id "
+                "LEFT JOIN cdc.course c ON c.id = r.course_id "
+                "WHERE s.student_id = :student_id "
+                "ORDER BY r.id"
+            ), {'student_id': student_id}).fetchall()
+        if not rows:
+            return None
+        return {
+            'mirrored': True,
+            'name': rows[0].name,
+            'student_id': rows[0].student_id,
+            'enrollments': [{
+                'id': row.registration_id,
+                'course_id': row.course_id,
+                'course_code': row.course_code,
+                'course_name': row.course_name,
+                'registration_date': row.registration_date
+            } for row in rows if row.course_code is not None]
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'configured': self.engine is not None,
+                'lag': self._lag,
+                'max_lag': self.max_lag,
+                'replica_reads': self.replica_reads,
+                'primary_reads': self.primary_reads
+            }
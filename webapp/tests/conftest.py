@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+# app.py connects at import time, so point it at a scratch SQLite database first
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'webapp.db')}")
+
+@pytest.fixture(scope='session')
+def client():
+    from app import app, db, course_cache, Course
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        for number in range(1, 21):
+            db.session.add(Course(code=f"T{number:03d}", name=f"Test course {number}"))
+        db.session.commit()
+    course_cache.invalidate()
+    return app.test_client()
+
+@pytest.fixture
+def sign_up(client):
+    """Sign up a student, enroll them in their first courses and return the enrolled course ids."""
+    from app import app, Course
+    def sign_up(student_id, enrollments):
+        client.get('/logout')
+        client.post('/signup', data={'username': f"user{student_id}", 'password': 'secret',
+                                     'confirm_password': 'secret', 'name': 'Test Student', 'student_id': student_id})
+        with app.app_context():
+            course_ids = [course.id for course in Course.query.order_by(Course.id).limit(enrollments)]
+        client.post('/register', data={'name': 'Test Student', 'student_id': student_id, 'courses': course_ids})
+        return course_ids
+    return sign_up
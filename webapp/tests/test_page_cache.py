@@ -0,0 +1,24 @@
+import app as webapp
+from app import student_page_cache, read_router
+
+def test_pages_read_from_the_mirror_are_not_cached(client, sign_up, monkeypatch):
+    sign_up('M1', 2)
+    student_page_cache.invalidate('M1')
+    # The session's read-your-writes window has ended and the mirror is fresh, but lags the enrollment
+    monkeypatch.setattr(webapp, 'READ_YOUR_WRITES_SECONDS', 0)
+    monkeypatch.setattr(read_router, 'available', lambda: True)
+    monkeypatch.setattr(read_router, 'student_enrollments', lambda student_id: {
+        'mirrored': True, 'name': 'Test Student', 'student_id': student_id, 'enrollments': []
+    })
+
+    response = client.get('/enrollments?student_id=M1')
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers and 'Last-Modified' not in response.headers
+    assert student_page_cache.pages('M1').fragments == {}
+
+    # Once the page comes from MySQL it is cached and validated again
+    monkeypatch.setattr(read_router, 'available', lambda: False)
+    response = client.get('/enrollments?student_id=M1')
+    assert b'T001' in response.data and 'ETag' in response.headers
+    assert client.get('/enrollments?student_id=M1',
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
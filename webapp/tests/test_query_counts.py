@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import event
+from app import app, db, course_cache, student_page_cache
+
+PAGES = ['/enrollments?student_id={}', '/manage-enrollments?student_id={}', '/register']
+
+@pytest.fixture
+def statements():
+    """SQL statements run against the database while the test runs."""
+    executed = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count)
+    yield executed
+    with app.app_context():
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+def page_queries(client, statements, student_id, url):
+    """Statements a page runs with nothing cached."""
+    course_cache.invalidate()
+    student_page_cache.invalidate(student_id)
+    del statements[:]
+    response = client.get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+@pytest.mark.parametrize('page', PAGES)
+def test_page_query_count_does_not_grow_with_enrollments(client, sign_up, statements, page):
+    counts = {}
+    for enrollments in (1, 15):
+        student_id = f"S{enrollments}-{PAGES.index(page)}"
+        sign_up(student_id, enrollments)
+        counts[enrollments] = page_queries(client, statements, student_id, page.format(student_id))
+
+    assert counts[1] == counts[15]
+    assert counts[1] <= 3